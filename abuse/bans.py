@@ -0,0 +1,172 @@
+"""Match users against hostmask bans.
+
+Masks are nick!user@host patterns using * and ?. Masks with a literal
+host go into hash buckets, IP and CIDR hosts (including 1.2.3.* style
+masks) into per prefix length network tables, and the rest into combined
+regexes bucketed by the literal suffix of their host, or failing that by
+the literal prefix of their nick.
+"""
+
+import ipaddress
+import re
+from irc.strings import lower
+
+
+def normalize(mask):
+    """Complete and lowercase a mask the way IRC servers do (foo -> foo!*@*)."""
+    if '@' not in mask:
+        mask = f'{mask}@*' if '!' in mask else f'{mask}!*@*'
+    elif '!' not in mask:
+        mask = f'*!{mask}'
+    nickuser, _, host = mask.partition('@')
+    return f'{lower(nickuser)}@{host.lower()}'
+
+
+def _pattern(mask):
+    """Translate an IRC wildcard mask into a regex pattern."""
+    return re.escape(mask).replace(r'\*', '.*').replace(r'\?', '.')
+
+
+def _network(host):
+    """Return the network a host pattern covers, or None if it is not an IP pattern."""
+    if '/' in host:
+        try:
+            return ipaddress.ip_network(host, strict=False)
+        except ValueError:
+            return None
+    octets = host.split('.')
+    if len(octets) == 4 and octets[-1] == '*':
+        fixed = octets[:-1]
+        while fixed and fixed[-1] == '*':
+            fixed.pop()
+        if all(octet.isdigit() for octet in fixed) and all(octet == '*' for octet in octets[len(fixed):]):
+            try:
+                return ipaddress.ip_network('.'.join(fixed + ['0'] * (4 - len(fixed))) + f'/{8 * len(fixed)}')
+            except ValueError:
+                return None
+    try:
+        address = ipaddress.ip_address(host)
+    except ValueError:
+        return None
+    return ipaddress.ip_network(address)
+
+
+def _anchor(mask):
+    """Return the bucket of a wildcard mask: ('@', host suffix) or ('!', nick prefix)."""
+    nickuser, _, host = mask.partition('@')
+    suffix = re.split(r'[*?]', host)[-1]
+    if suffix:
+        return ('@', suffix)
+    return ('!', re.split(r'[*?!]', nickuser)[0])
+
+
+class _Bucket:
+    """Wildcard masks sharing a literal host suffix, matched by one regex."""
+
+    def __init__(self):
+        self.masks = []
+        self.regex = None
+
+    def add(self, mask):
+        self.masks.append(mask)
+        self.regex = None
+
+    def match(self, text):
+        if self.regex is None:
+            self.regex = re.compile('(?:' + '|'.join(
+                f'(?P<m{i}>{_pattern(mask)})' for i, mask in enumerate(self.masks)
+            ) + r')\Z', re.S)
+        found = self.regex.match(text)
+        if found is None:
+            return None
+        return self.masks[int(found.lastgroup[1:])]
+
+
+class BanIndex:
+    """An index of ban masks.
+
+    The index is built once; VoidBot builds a new one whenever it loads
+    the ban list.
+    """
+
+    def __init__(self, masks=()):
+        """Create an index holding :masks:."""
+        self.masks = {}  # normalized -> original mask
+        self.exact = {}  # host -> {mask: nick!user regex or None}
+        self.networks = {}  # (version, prefix length) -> {network: {mask: nick!user regex or None}}
+        self.wildcards = {}  # anchor -> _Bucket
+        for mask in masks:
+            self._add(mask)
+
+    def __len__(self):
+        """Return the number of masks."""
+        return len(self.masks)
+
+    def __contains__(self, mask):
+        """Check whether :mask: is in the index."""
+        return normalize(mask) in self.masks
+
+    @staticmethod
+    def _nickuser(mask):
+        nickuser = mask.partition('@')[0]
+        if nickuser == '*!*':
+            return None
+        return re.compile(_pattern(nickuser) + r'\Z', re.S)
+
+    def _add(self, mask):
+        """Add :mask: to the index."""
+        key = normalize(mask)
+        if key in self.masks:
+            return
+        self.masks[key] = mask
+        host = key.partition('@')[2]
+        network = _network(host)
+        if network is not None:
+            table = self.networks.setdefault((network.version, network.prefixlen), {})
+            table.setdefault(network, {})[key] = self._nickuser(key)
+        elif '*' not in host and '?' not in host:
+            self.exact.setdefault(host, {})[key] = self._nickuser(key)
+        else:
+            self.wildcards.setdefault(_anchor(key), _Bucket()).add(key)
+
+    @staticmethod
+    def _check(candidates, nickuser):
+        for mask, regex in candidates.items():
+            if regex is None or regex.match(nickuser):
+                return mask
+        return None
+
+    def match(self, source):
+        """Return the original mask matching :source: (nick!user@host), or None."""
+        nickuser, _, host = source.partition('@')
+        nickuser = lower(nickuser)
+        host = host.lower()
+        found = None
+        if host in self.exact:
+            found = self._check(self.exact[host], nickuser)
+        if found is None and self.networks:
+            try:
+                address = ipaddress.ip_address(host)
+            except ValueError:
+                address = None
+            if address is not None:
+                for (version, prefixlen), table in self.networks.items():
+                    if version != address.version:
+                        continue
+                    network = ipaddress.ip_network(f'{address}/{prefixlen}', strict=False)
+                    if network in table:
+                        found = self._check(table[network], nickuser)
+                        if found is not None:
+                            break
+        if found is None and self.wildcards:
+            text = f'{nickuser}@{host}'
+            nick = nickuser.partition('!')[0]
+            anchors = [('@', host[i:]) for i in range(len(host))]
+            anchors += [('!', nick[:i]) for i in range(len(nick) + 1)]
+            for anchor in anchors:
+                bucket = self.wildcards.get(anchor)
+                if bucket is not None:
+                    found = bucket.match(text)
+                    if found is not None:
+                        break
+        return None if found is None else self.masks[found]
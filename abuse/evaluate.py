@@ -0,0 +1,160 @@
+"""Evaluate the abuse models offline.
+
+Run from the repository root with: python -m abuse.evaluate [dataset.csv]
+Splits the dataset into stratified folds and fits every model variant on
+each fold in its own process. Reports precision, recall and F1 of both
+classifiers, of the classifier2 score thresholds used by MLHandler, and
+per-message scoring latency. Use --json to write the results for
+regression tracking.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import time
+from concurrent.futures import ProcessPoolExecutor
+from sklearn.metrics import precision_recall_fscore_support
+from sklearn.model_selection import StratifiedKFold
+from abuse import ml, workers
+from abuse.heuristics import RuleSet
+
+variants = {
+    'default': {},
+    'strong-regularization': {'alpha': 1e-5, 'alpha2': 1e-4},
+    'weak-regularization': {'alpha': 1e-7, 'alpha2': 1e-6},
+}
+thresholds = (50, 80, 90, 95)  # Points of classifier2; MLHandler trips at 95
+latency_sample = 500  # Messages scored one at a time per fold
+
+_data = None
+
+
+def _load(path):
+    """Load the dataset once per worker process."""
+    global _data
+    if _data is None:
+        _data = ml.load(path)
+    return _data
+
+
+def _scores(labels, predicted):
+    precision, recall, f1, _ = precision_recall_fscore_support(labels, predicted, average='binary', zero_division=0)
+    return {'precision': float(precision), 'recall': float(recall), 'f1': float(f1)}
+
+
+def run_fold(path, variant, train, test, rules=None):
+    """Fit :variant: on the :train: rows and evaluate it on the :test: rows.
+
+    :param rules: (string) Path of heuristic rules to add to the classifier2 points
+    :return: (dict) Results of the fold
+    """
+    texts, labels = _load(path)
+    begin = time.perf_counter()
+    vectorizer, classifier, classifier2 = ml.fit(texts[train], labels[train], **variants[variant])
+    fitted = time.perf_counter() - begin
+    texts, labels = texts[test], labels[test]
+
+    begin = time.perf_counter()
+    wordbag = vectorizer.transform(texts)
+    verdicts = classifier.predict(wordbag)
+    probabilities = classifier2.predict_proba(wordbag)[:, 1]
+    verdicts2 = classifier2.predict(wordbag)
+    batch = time.perf_counter() - begin
+
+    points = (probabilities * 100).astype(int)
+    if rules is not None:
+        ruleset = RuleSet(rules)
+        ruleset.path = None  # Loaded, no need to watch the file
+        points = points + [sum(ruleset.score(text).values()) for text in texts]
+    results = {
+        'classifier': _scores(labels, verdicts),
+        'classifier2': _scores(labels, verdicts2),
+        'thresholds': {str(threshold): _scores(labels, points >= threshold) for threshold in thresholds},
+        'tripped': _scores(labels, (points >= 95) | verdicts2.astype(bool)),  # What MLHandler logs
+    }
+
+    latencies = []
+    for text in texts[:latency_sample]:
+        begin = time.perf_counter()
+        workers.score(vectorizer, classifier, classifier2, text)
+        latencies.append(time.perf_counter() - begin)
+    latencies.sort()
+    results['cost'] = {
+        'fit_seconds': fitted,
+        'batch_messages_per_second': len(texts) / batch,
+        'latency_ms_p50': latencies[len(latencies) // 2] * 1000,
+        'latency_ms_p95': latencies[int(len(latencies) * 0.95)] * 1000,
+    }
+    return results
+
+
+def _average(folds):
+    """Average the numbers of several fold results, keeping their layout."""
+    first = folds[0]
+    if isinstance(first, dict):
+        return {key: _average([fold[key] for fold in folds]) for key in first}
+    return statistics.fmean(folds)
+
+
+def evaluate(path, names=None, folds=5, jobs=None, rules=None, seed=1):
+    """Evaluate model variants :names: on :folds: folds of the dataset at :path:.
+
+    :param jobs: (int) Worker processes, one per core by default
+    :return: (dict) Variant name to averaged results and per fold results
+    """
+    texts, labels = ml.load(path)
+    splits = list(StratifiedKFold(n_splits=folds, shuffle=True, random_state=seed).split(texts, labels))
+    names = names or list(variants)
+    with ProcessPoolExecutor(max_workers=jobs or os.cpu_count()) as pool:
+        futures = {
+            name: [pool.submit(run_fold, path, name, train, test, rules) for train, test in splits]
+            for name in names
+        }
+        results = {}
+        for name, pending in futures.items():
+            per_fold = [future.result() for future in pending]
+            results[name] = {'mean': _average(per_fold), 'folds': per_fold}
+    return results
+
+
+def report(results):
+    """Return the results as human readable lines."""
+    lines = []
+    for name, result in results.items():
+        mean = result['mean']
+        lines.append(f'{name} ({len(result["folds"])} folds)')
+        rows = [('classifier', mean['classifier']), ('classifier2', mean['classifier2'])]
+        rows += [(f'points >= {threshold}', scores) for threshold, scores in mean['thresholds'].items()]
+        rows.append(('tripped', mean['tripped']))
+        for label, scores in rows:
+            lines.append(f'  {label:16} precision {scores["precision"]:.3f}  recall {scores["recall"]:.3f}  f1 {scores["f1"]:.3f}')
+        cost = mean['cost']
+        lines.append(
+            f'  fit {cost["fit_seconds"]:.2f}s, {cost["batch_messages_per_second"]:,.0f} msg/s batched,'
+            f' {cost["latency_ms_p50"]:.2f}ms p50 / {cost["latency_ms_p95"]:.2f}ms p95 per message'
+        )
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Evaluate the abuse models with k-fold cross validation.')
+    parser.add_argument('dataset', nargs='?', default='abuse/dataset.csv')
+    parser.add_argument('--variant', action='append', choices=list(variants), help='Variant to evaluate, all by default')
+    parser.add_argument('--folds', type=int, default=5)
+    parser.add_argument('--jobs', type=int, default=None, help='Worker processes, one per core by default')
+    parser.add_argument('--rules', help='Add the points of these heuristic rules, as MLHandler does')
+    parser.add_argument('--json', help='Also write the results to this file')
+    args = parser.parse_args()
+    begin = time.perf_counter()
+    results = evaluate(args.dataset, args.variant, args.folds, args.jobs, args.rules)
+    for line in report(results):
+        print(line)
+    print(f'Evaluated in {time.perf_counter() - begin:.1f}s')
+    if args.json:
+        with open(args.json, 'w') as export:
+            export.write(json.dumps({'dataset': args.dataset, 'folds': args.folds, 'variants': results}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,206 @@
+"""Heuristic rules scored alongside the classifiers.
+
+Rules live in a JSON file and are compiled together: keyword rules into a
+single Aho-Corasick automaton that scans each message once, regex rules
+into one merged regex matched with a single call. The merged regex holds a
+lookahead per rule, each of which still scans the message, so it makes one
+pass per regex rule (in C, without a Python loop over the rules). The file
+is reloaded when it changes. Format:
+
+    {"rules": [
+        {"name": "slurs", "type": "keyword", "words": ["..."], "points": 40},
+        {"name": "shorteners", "type": "regex", "pattern": "https?://bit\\.ly/", "points": 20},
+        {"name": "staff", "type": "host", "hosts": ["miraheze/Void"], "points": -1000},
+        {"name": "repeats", "type": "repeat", "count": 3, "window": 60, "points": 30}
+    ]}
+
+Keyword rules match whole words only, case insensitively. Regex rules
+using backreferences, named groups or inline global flags such as (?x)
+cannot be merged and are matched on their own.
+Repeat rules match when the sender sent the same message :count: times
+(this one included) within :window: seconds, using the channel history.
+Each rule adds its points once per message, however often it matches.
+"""
+
+import json
+import logging
+import os
+import re
+import time
+from abuse import normalize
+
+log = logging.getLogger(__name__)
+
+
+class Automaton:
+    """An Aho-Corasick automaton finding many keywords in one pass."""
+
+    def __init__(self, keywords):
+        """Build the automaton.
+
+        :param keywords: (dict) Keyword to a list of values reported on match
+        """
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [[]]
+        for keyword, values in keywords.items():
+            state = 0
+            for char in keyword:
+                if char not in self.goto[state]:
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append([])
+                    self.goto[state][char] = len(self.goto) - 1
+                state = self.goto[state][char]
+            self.output[state].append((len(keyword), values))
+        queue = list(self.goto[0].values())
+        for state in queue:  # Breadth first, so fail links point to finished states
+            for char, child in self.goto[state].items():
+                queue.append(child)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.goto[fallback].get(char, 0) if self.goto[fallback].get(char) != child else 0
+                self.output[child] = self.output[child] + self.output[self.fail[child]]
+
+    def search(self, text):
+        """Yield (start, end, values) for every keyword occurrence in :text:."""
+        goto, fail, output = self.goto, self.fail, self.output
+        state = 0
+        for end, char in enumerate(text, 1):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for length, values in output[state]:
+                yield end - length, end, values
+
+
+class RuleSet:
+    """All heuristic rules, compiled together."""
+
+    check_interval = 10  # Seconds between checks of the rule file for changes
+
+    def __init__(self, path=None):
+        """Load rules from :path:, if given."""
+        self.path = path
+        self.mtime = None
+        self.checked = 0
+        self.compile([])
+        if path is not None:
+            self.reload()
+
+    def compile(self, rules):
+        """Compile a list of rule dicts, leaving the current rules in place if one is broken.
+
+        Keywords and patterns are normalized like the messages they are
+        matched against, so rules written with Cyrillic or Greek letters
+        match too.
+        """
+        names = [rule['name'] for rule in rules]
+        points = [rule.get('points', 0) for rule in rules]
+        keywords = {}
+        patterns = []
+        separate = []
+        hosts = {}
+        repeats = []
+        for index, rule in enumerate(rules):
+            kind = rule.get('type', 'keyword')
+            if kind == 'keyword':
+                for word in rule['words']:
+                    keywords.setdefault(normalize.clean(word).casefold(), []).append(index)
+            elif kind == 'regex':
+                pattern = normalize.clean(rule['pattern'])
+                compiled = re.compile(pattern, re.I | re.S)  # Fail early on bad patterns
+                lookahead = self._lookahead(index, pattern, compiled)
+                if lookahead is None:
+                    separate.append((index, compiled))
+                else:
+                    patterns.append(lookahead)
+            elif kind == 'host':
+                for host in rule['hosts']:
+                    hosts.setdefault(host, []).append(index)
+            elif kind == 'repeat':
+                repeats.append((index, rule['count'], rule['window']))
+            else:
+                raise ValueError(f'Unknown rule type "{kind}" in rule "{rule["name"]}"')
+        automaton = Automaton(keywords) if keywords else None
+        regex = re.compile(''.join(patterns), re.I | re.S) if patterns else None
+        self.automaton, self.regex = automaton, regex
+        self.names, self.points, self.separate, self.hosts, self.repeats = names, points, separate, hosts, repeats
+        self.window = max((window for _, _, window in repeats), default=0)  # History needed by repeat rules
+
+    @staticmethod
+    def _lookahead(index, pattern, compiled):
+        """Return regex rule :index: as a lookahead of the merged regex, or None if it cannot be merged.
+
+        Named groups would clash with those of other rules, group numbers of
+        backreferences shift when merged, and global inline flags are only
+        allowed at the start of a regex.
+        """
+        if compiled.groupindex or re.search(r'\\\d|\(\?P=', pattern):
+            return None
+        lookahead = f'(?=.*?(?P<r{index}>(?:{pattern})))?'
+        try:
+            re.compile(lookahead, re.I | re.S)
+        except re.error:
+            return None
+        return lookahead
+
+    def reload(self):
+        """Reload the rule file, keeping the old rules if it is broken.
+
+        :return: (boolean) Whether new rules were loaded
+        """
+        self.checked = time.monotonic()
+        try:
+            mtime = os.stat(self.path).st_mtime
+            if mtime == self.mtime:
+                return False
+            with open(self.path, 'r') as rules:
+                self.compile(json.loads(rules.read())['rules'])
+        except FileNotFoundError:
+            return False
+        except (ValueError, KeyError, re.error) as e:
+            log.error(f'Could not load heuristics from {self.path}: {e}')
+            return False
+        self.mtime = mtime
+        log.info(f'Loaded {len(self.names)} heuristic rules')
+        return True
+
+    def score(self, text, host=None, history=()):
+        """Scan :text: once and return the points of each rule that matched.
+
+        :param text: (Normalized) Message to scan, strings are normalized first
+        :param host: (string) Host of the sender, for host rules
+        :param history: (list) Earlier history.Record of the sender, newest first, for repeat rules
+        :return: (dict) Rule name to points
+        """
+        if self.path is not None and time.monotonic() - self.checked > self.check_interval:
+            self.reload()
+        if not isinstance(text, normalize.Normalized):
+            text = normalize.Normalized(text)
+        matched = set()
+        folded = text.folded
+        if self.automaton is not None:
+            for start, end, indices in self.automaton.search(folded):
+                if (start == 0 or not folded[start - 1].isalnum()) and (end == len(folded) or not folded[end].isalnum()):
+                    matched.update(indices)
+        if self.regex is not None:
+            found = self.regex.match(text.text)
+            matched.update(int(name[1:]) for name, value in found.groupdict().items() if value is not None)
+        for index, compiled in self.separate:
+            if compiled.search(text.text):
+                matched.add(index)
+        if host is not None:
+            matched.update(self.hosts.get(host, []))
+        if self.repeats and history:
+            now = time.time()
+            for index, count, window in self.repeats:
+                same = sum(1 for record in history if now - record.time <= window and record.text.casefold() == folded)
+                if same + 1 >= count:
+                    matched.add(index)
+        return {self.names[index]: self.points[index] for index in matched}
+
+    def apply(self, event):
+        """Return the total points of a message event."""
+        return sum(self.score(normalize.of(event), event.source.host).values())
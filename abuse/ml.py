@@ -1,30 +1,80 @@
 """Module for machine learning utilities."""
 
+import os
 import pandas as pd
+import pickle
 import nltk
 from nltk.corpus import stopwords
-import string
 from sklearn.feature_extraction.text import CountVectorizer
 from sklearn.linear_model import SGDClassifier
+from abuse import normalize
+
+version = 2  # Bump when process_text changes, so saved models are refitted
+tol = 1e-6, 1e-5  # Stopping tolerances of classifier and classifier2, kept fixed when alpha is varied
+
+
+_stopwords = None
 
 
 def process_text(text):
-    """Take input text and tokenize it."""
-    nopunc = [char for char in text if char not in string.punctuation]
-    nopunc = ''.join(nopunc)
+    """Take input text, or normalize.Normalized text, and tokenize it."""
+    global _stopwords
+    if _stopwords is None:
+        _stopwords = frozenset(stopwords.words('english'))  # Loading the list is slow, do it once
+    if not isinstance(text, normalize.Normalized):
+        text = normalize.Normalized(text)
+    return [word for word in text.tokens if word.lower() not in _stopwords]
 
-    clean_words = [word for word in nopunc.split() if word.lower() not in stopwords.words('english')]
-    return clean_words
 
+def fit(texts, labels, alpha=1e-6, alpha2=1e-5):
+    """Build and fit a vectorizer and both classifiers on :texts: and their :labels:.
 
-def train(path):
-    """Build and fit a vectorizer and classifier using data from the supplied path."""
+    :param alpha: (float) Regularization of classifier
+    :param alpha2: (float) Regularization of classifier2
+    """
     nltk.download('stopwords', quiet=True)
-    df = pd.read_csv(path)
     vectorizer = CountVectorizer(analyzer=process_text)
-    messages_bow = vectorizer.fit_transform(df['text'].values.astype(str))
-    classifier = SGDClassifier(loss='hinge', alpha=1e-6, tol=1e-6)
-    classifier.fit(messages_bow, df['abuse'])
-    classifier2 = SGDClassifier(loss='log', alpha=1e-5, tol=1e-5)
-    classifier2.fit(messages_bow, df['abuse'])
+    messages_bow = vectorizer.fit_transform(texts)
+    classifier = SGDClassifier(loss='hinge', alpha=alpha, tol=tol[0])
+    classifier.fit(messages_bow, labels)
+    log_loss = 'log_loss' if 'log_loss' in SGDClassifier.loss_functions else 'log'  # Renamed in scikit-learn 1.1
+    classifier2 = SGDClassifier(loss=log_loss, alpha=alpha2, tol=tol[1])
+    classifier2.fit(messages_bow, labels)
     return (vectorizer, classifier, classifier2)
+
+
+def load(path):
+    """Read texts and labels from the dataset at the supplied path."""
+    df = pd.read_csv(path)
+    return df['text'].values.astype(str), df['abuse'].values
+
+
+def train(path):
+    """Build and fit a vectorizer and classifier using data from the supplied path."""
+    return fit(*load(path))
+
+
+def fingerprint(path):
+    """Identify the version of the dataset at the supplied path."""
+    stat = os.stat(path)
+    return (stat.st_size, stat.st_mtime_ns)
+
+
+def save_model(path, models, dataset):
+    """Write fitted models to the supplied path, tagged with the dataset they were fitted on."""
+    temp = f'{path}.tmp'
+    with open(temp, 'wb') as artifact:
+        pickle.dump({'dataset': fingerprint(dataset), 'version': version, 'models': models}, artifact, pickle.HIGHEST_PROTOCOL)
+    os.replace(temp, path)
+
+
+def load_model(path, dataset):
+    """Return the models saved by save_model, or None if missing or fitted on another dataset or process_text."""
+    try:
+        with open(path, 'rb') as artifact:
+            saved = pickle.load(artifact)
+        if saved['dataset'] != fingerprint(dataset) or saved.get('version') != version:
+            return None
+        return saved['models']
+    except (OSError, pickle.UnpicklingError, EOFError, KeyError, AttributeError):
+        return None
@@ -0,0 +1,76 @@
+"""Normalize message text once for every consumer.
+
+IRC formatting and control codes and zero width characters are dropped,
+compatibility forms (fullwidth, mathematical letters) are folded by NFKC,
+and common Cyrillic and Greek lookalikes are mapped to Latin letters, so
+"ѕtuрid" (with Cyrillic s and p) reads like "stupid". Everything but the
+colour codes is done with precomputed translate tables.
+"""
+
+import re
+import string
+import unicodedata
+from functools import cached_property
+
+_formatting = re.compile(r'\x03(?:\d{1,2}(?:,\d{1,2})?)?|\x04(?:[0-9a-fA-F]{6}(?:,[0-9a-fA-F]{6})?)?')
+
+_dropped = [chr(code) for code in range(32) if chr(code) not in '\t\n\r']  # Bold, italics, reset...
+_dropped += ['\x7f', '\xad', '\u200b', '\u200c', '\u200d', '\u2060', '\ufeff']  # Invisible characters
+
+_confusables = {
+    'а': 'a', 'в': 'b', 'е': 'e', 'ё': 'e', 'к': 'k', 'м': 'm', 'н': 'h', 'о': 'o', 'р': 'p', 'с': 'c',
+    'т': 't', 'у': 'y', 'х': 'x', 'ѕ': 's', 'і': 'i', 'ї': 'i', 'ј': 'j', 'ԁ': 'd', 'ɡ': 'g', 'һ': 'h',
+    'А': 'A', 'В': 'B', 'Е': 'E', 'К': 'K', 'М': 'M', 'Н': 'H', 'О': 'O', 'Р': 'P', 'С': 'C', 'Т': 'T',
+    'Х': 'X', 'Ѕ': 'S', 'І': 'I', 'Ј': 'J', 'Ё': 'E', 'У': 'Y', 'Ї': 'I', 'Һ': 'H', 'Ԁ': 'D',
+    'α': 'a', 'β': 'b', 'ε': 'e', 'ι': 'i', 'κ': 'k', 'ν': 'v', 'ο': 'o', 'ρ': 'p', 'τ': 't', 'υ': 'u',
+    'χ': 'x', 'Α': 'A', 'Β': 'B', 'Ε': 'E', 'Ζ': 'Z', 'Η': 'H', 'Ι': 'I', 'Κ': 'K', 'Μ': 'M', 'Ν': 'N',
+    'Ο': 'O', 'Ρ': 'P', 'Τ': 'T', 'Υ': 'Y', 'Χ': 'X',
+}
+
+_table = str.maketrans({**dict.fromkeys(_dropped), **_confusables})
+_punctuation = str.maketrans('', '', string.punctuation)
+
+
+def clean(text):
+    """Return :text: without formatting, control codes or lookalike letters."""
+    if '\x03' in text or '\x04' in text:
+        text = _formatting.sub('', text)
+    if not text.isascii():
+        text = unicodedata.normalize('NFKC', text)
+    return text.translate(_table)
+
+
+class Normalized:
+    """A message in the forms its consumers need.
+
+    :raw: as received, :text: cleaned, :folded: cleaned and case folded,
+    :tokens: words of the cleaned text without punctuation, in their
+    original case as the classifiers were trained on them.
+    """
+
+    def __init__(self, raw):
+        """Normalize :raw:."""
+        self.raw = raw
+        self.text = clean(raw)
+
+    def __str__(self):
+        """Return the cleaned text."""
+        return self.text
+
+    @cached_property
+    def folded(self):
+        """Return the cleaned text, case folded."""
+        return self.text.casefold()
+
+    @cached_property
+    def tokens(self):
+        """Return the words of the cleaned text, without punctuation."""
+        return self.text.translate(_punctuation).split()
+
+
+def of(event):
+    """Return the Normalized text of a message event, normalizing it only the first time."""
+    normalized = getattr(event, 'normalized', None)
+    if normalized is None:
+        normalized = event.normalized = Normalized(' '.join(event.arguments))
+    return normalized
@@ -0,0 +1,197 @@
+"""Streaming join flood (raid) detection.
+
+Memory per channel is fixed no matter how many users join.
+"""
+
+import irc.strings
+import re
+import time
+
+_digits = re.compile(r'\d+')
+_netsplit = re.compile(r'[\w*-]+(?:\.[\w*-]+)+ [\w*-]+(?:\.[\w*-]+)+\Z')  # "*.net *.split", no "Quit: " prefix
+
+# Keys that gateways hand out to unrelated users, matched against what
+# shape() makes of them: IRCCloud idents (sid12345) and hosts, default
+# webchat nicks (guest123) and webchat realnames (the url of the client)
+gateways = {
+    'host': re.compile(r'(?:.*\.)?irccloud\.com\Z'),
+    'nick': re.compile(r'(?:guest|webchat|kiwi|mib)_*#_*\Z'),
+    'ident': re.compile(r'[su]id#\Z'),
+    'realname': re.compile(r'https?://'),
+}
+
+
+class RollingCounter:
+    """Count events over the last :window: seconds using fixed buckets."""
+
+    def __init__(self, window=10, buckets=10):
+        """Create a counter of :buckets: slots spanning :window: seconds."""
+        self.width = window / buckets
+        self.counts = [0] * buckets
+        self.stamps = [-1] * buckets  # Which slot number each bucket holds
+
+    def add(self, now, amount=1):
+        """Count :amount: events at time :now:."""
+        slot = int(now / self.width)
+        index = slot % len(self.counts)
+        if self.stamps[index] != slot:
+            self.stamps[index] = slot
+            self.counts[index] = 0
+        self.counts[index] += amount
+
+    def rebase(self, offset):
+        """Move every bucket by :offset: seconds, to the nearest bucket, for another clock."""
+        shift = round(offset / self.width)
+        self.stamps = [stamp if stamp == -1 else stamp + shift for stamp in self.stamps]
+
+    def total(self, now):
+        """Return the number of events within the window."""
+        oldest = int(now / self.width) - len(self.counts)
+        return sum(count for count, stamp in zip(self.counts, self.stamps) if stamp > oldest)
+
+
+class SpaceSaving:
+    """Find the most frequent keys of a stream using at most :size: counters.
+
+    Counts are overestimated by at most the smallest count kept.
+    """
+
+    def __init__(self, size=32):
+        """Create an empty sketch."""
+        self.size = size
+        self.counts = {}
+
+    def add(self, key):
+        """Count one occurrence of :key: and return its estimated count."""
+        counts = self.counts
+        if key in counts:
+            counts[key] += 1
+        elif len(counts) < self.size:
+            counts[key] = 1
+        else:
+            smallest = min(counts, key=counts.get)
+            counts[key] = counts.pop(smallest) + 1
+        return counts[key]
+
+    def top(self, n=3):
+        """Return the :n: most frequent keys with their counts."""
+        return sorted(self.counts.items(), key=lambda item: item[1], reverse=True)[:n]
+
+    def clear(self):
+        """Forget everything."""
+        self.counts.clear()
+
+
+def shape(text):
+    """Reduce a nick, ident or realname to a pattern shared by clones (guest123 -> guest#)."""
+    return _digits.sub('#', text.lower())
+
+
+def is_netsplit(message):
+    """Check whether a QUIT :message: was sent by the server for a netsplit."""
+    return _netsplit.match(message) is not None
+
+
+class Netsplits:
+    """Remember who quit in a netsplit, so their rejoins do not look like a raid."""
+
+    def __init__(self, grace=600):
+        """Ignore rejoins up to :grace: seconds after the split."""
+        self.grace = grace
+        self.quits = {}  # Lowered nick -> time of the split, oldest first
+
+    def quit(self, nick, message, now=None):
+        """Feed a QUIT of :nick: with :message:."""
+        if not is_netsplit(message):
+            return
+        if now is None:
+            now = time.monotonic()
+        nick = irc.strings.lower(nick)
+        self.quits.pop(nick, None)
+        self.quits[nick] = now
+        for nick, at in list(self.quits.items()):
+            if now - at < self.grace:
+                break
+            del self.quits[nick]
+
+    def rejoining(self, nick, now=None):
+        """Check whether :nick: quit in a netsplit within the grace period."""
+        at = self.quits.get(irc.strings.lower(nick))
+        if at is None:
+            return False
+        if now is None:
+            now = time.monotonic()
+        return now - at < self.grace
+
+    def rebase(self, offset):
+        """Move every time by :offset: seconds, for state saved against another monotonic clock."""
+        self.quits = {nick: at + offset for nick, at in self.quits.items()}
+
+
+class RaidDetector:
+    """Watch the joins of one channel for floods and clones.
+
+    Trips when more than :rate: users join within :window: seconds, or when
+    :clones: joins within one sketch period share a host or a nick, ident or
+    realname pattern. Keys matching :gateways: are shared by unrelated
+    users of one gateway and not counted.
+    """
+
+    def __init__(self, rate=12, window=10, clones=6, period=60, cooldown=300, gateways=gateways):
+        """Create a detector.
+
+        :param rate: (int) Joins within window that count as a flood
+        :param window: (int) Seconds the join rate is measured over
+        :param clones: (int) Joins sharing a key that count as clones
+        :param period: (int) Seconds after which the sketches start over
+        :param cooldown: (int) Seconds to stay quiet after tripping
+        :param gateways: (dict) Kind of key to the regex of keys not to count
+        """
+        self.rate = rate
+        self.gateways = gateways
+        self.clones = clones
+        self.period = period
+        self.cooldown = cooldown
+        self.joins = RollingCounter(window)
+        self.sketches = {'host': SpaceSaving(), 'nick': SpaceSaving(), 'ident': SpaceSaving(), 'realname': SpaceSaving()}
+        self.period_start = 0
+        self.tripped_at = None
+
+    def rebase(self, offset):
+        """Move every time by :offset: seconds, for state saved against another monotonic clock."""
+        self.period_start += offset
+        if self.tripped_at is not None:
+            self.tripped_at += offset
+        self.joins.rebase(offset)
+
+    def join(self, source, realname=None, now=None):
+        """Feed a join from :source: (a NickMask).
+
+        :return: (string) Why the channel looks raided, or None
+        """
+        if now is None:
+            now = time.monotonic()
+        if now - self.period_start >= self.period:
+            self.period_start = now
+            for sketch in self.sketches.values():
+                sketch.clear()
+        self.joins.add(now)
+        keys = {'host': source.host, 'nick': shape(source.nick), 'ident': shape(source.user.lstrip('~'))}
+        if realname:
+            keys['realname'] = shape(realname)
+        reason = None
+        for kind, key in keys.items():
+            exempt = self.gateways.get(kind)
+            if exempt is not None and exempt.match(key):
+                continue
+            if self.sketches[kind].add(key) >= self.clones and reason is None:
+                reason = f'{self.clones}+ joins sharing {kind} "{key}"'
+        total = self.joins.total(now)
+        if reason is None and total >= self.rate:
+            reason = f'{total} joins within {int(self.joins.width * len(self.joins.counts))}s'
+        if reason is None:
+            return None
+        if self.tripped_at is not None and now - self.tripped_at < self.cooldown:
+            return None
+        self.tripped_at = now
+        return reason
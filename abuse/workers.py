@@ -0,0 +1,175 @@
+"""Score messages on several cores.
+
+The model is exported once as memory-mapped numpy arrays, so every worker
+process shares the same pages instead of unpickling its own copy:
+sorted vocabulary terms, their feature indices, and the coefficients and
+intercepts of both classifiers. Each worker has its own bounded queue;
+when the pool is missing, dead or full, callers score in-process instead.
+Workers are spawned, so the script starting the bot needs the usual
+``if __name__ == '__main__':`` guard.
+"""
+
+import logging
+import multiprocessing
+import numpy as np
+import os
+import queue
+import threading
+from abuse import ml
+
+log = logging.getLogger(__name__)
+
+
+def score(vectorizer, classifier, classifier2, text):
+    """Score :text: in-process.
+
+    :return: (tuple) classifier verdict, classifier2 probability, classifier2 verdict
+    """
+    wordbag = vectorizer.transform([text])
+    return (
+        bool(classifier.predict(wordbag)[0]),
+        float(classifier2.predict_proba(wordbag)[0][1]),
+        bool(classifier2.predict(wordbag)[0])
+    )
+
+
+def export_model(vectorizer, classifier, classifier2, path):
+    """Write the model as memory-mappable arrays into directory :path:."""
+    os.makedirs(path, exist_ok=True)
+    vocabulary = vectorizer.vocabulary_
+    terms = np.array(sorted(vocabulary))
+    np.save(os.path.join(path, 'terms.npy'), terms)
+    np.save(os.path.join(path, 'features.npy'), np.array([vocabulary[term] for term in terms], dtype=np.int64))
+    np.save(os.path.join(path, 'coef.npy'), np.vstack([classifier.coef_[0], classifier2.coef_[0]]))
+    np.save(os.path.join(path, 'intercept.npy'), np.array([classifier.intercept_[0], classifier2.intercept_[0]]))
+
+
+class MappedModel:
+    """A model exported by export_model, attached read-only."""
+
+    def __init__(self, path):
+        """Map the arrays in :path:."""
+        self.terms = np.load(os.path.join(path, 'terms.npy'), mmap_mode='r')
+        self.features = np.load(os.path.join(path, 'features.npy'), mmap_mode='r')
+        self.coef = np.load(os.path.join(path, 'coef.npy'), mmap_mode='r')
+        self.intercept = np.load(os.path.join(path, 'intercept.npy'))
+        self.longest = self.terms.dtype.itemsize // np.dtype('U1').itemsize
+
+    def score(self, text):
+        """Score :text:, or the words ml.process_text() made of it, the same way as score()."""
+        if not isinstance(text, list):
+            text = ml.process_text(text)
+        words = [word for word in text if len(word) <= self.longest]  # Longer ones are never terms
+        tokens, counts = np.unique(np.array(words, dtype=self.terms.dtype), return_counts=True)
+        decision = self.intercept.copy()
+        if len(tokens):
+            found = np.searchsorted(self.terms, tokens)
+            found[found == len(self.terms)] = 0
+            known = self.terms[found] == tokens
+            features = self.features[found[known]]
+            decision += self.coef[:, features] @ counts[known]
+        return (bool(decision[0] > 0), float(1 / (1 + np.exp(-decision[1]))), bool(decision[1] > 0))
+
+
+def _work(path, inbox, outbox):
+    """Main loop of a worker process."""
+    model = MappedModel(path)
+    while True:
+        job = inbox.get()
+        if job is None:
+            return
+        key, text = job
+        try:
+            outbox.put((key, model.score(text)))
+        except Exception as e:
+            outbox.put((key, e))
+
+
+class ScoringPool:
+    """Worker processes scoring messages from their own queues."""
+
+    def __init__(self, path, workers=None, queue_size=64):
+        """Start the workers.
+
+        :param path: (string) Directory written by export_model
+        :param workers: (int) Number of processes, one per core by default
+        :param queue_size: (int) Messages a worker may have waiting
+        """
+        self.path = path
+        context = multiprocessing.get_context('spawn')  # Do not fork the IRC connection
+        self.outbox = context.Queue()
+        self.inboxes = []
+        self.processes = []
+        for _ in range(workers or os.cpu_count()):
+            inbox = context.Queue(queue_size)
+            process = context.Process(target=_work, args=(path, inbox, self.outbox), daemon=True)
+            process.start()
+            self.inboxes.append(inbox)
+            self.processes.append(process)
+        self.callbacks = {}
+        self.lock = threading.Lock()
+        self.counter = 0
+        self.next = 0
+        self.collector = threading.Thread(target=self._collect, daemon=True)
+        self.collector.start()
+
+    @property
+    def alive(self):
+        """Return the number of running workers."""
+        return sum(process.is_alive() for process in self.processes)
+
+    def submit(self, text, callback):
+        """Queue :text:, or the words ml.process_text() made of it, for scoring.
+
+        callback(result) is called from the collector thread.
+
+        :return: (boolean) False if no worker could take it; score in-process then
+        """
+        with self.lock:
+            key = self.counter
+            self.counter += 1
+            self.callbacks[key] = callback
+            for i in range(len(self.inboxes)):
+                worker = (self.next + i) % len(self.inboxes)
+                if not self.processes[worker].is_alive():
+                    continue
+                try:
+                    self.inboxes[worker].put_nowait((key, text))
+                except queue.Full:
+                    continue
+                self.next = worker + 1
+                return True
+            self.callbacks.pop(key)
+            return False
+
+    def _collect(self):
+        """Hand results to their callbacks."""
+        while True:
+            try:
+                key, result = self.outbox.get()
+            except (EOFError, OSError):
+                return  # A worker was killed mid-write, the pool is closing
+            if key is None:
+                return
+            with self.lock:
+                callback = self.callbacks.pop(key, None)
+            if isinstance(result, Exception):
+                log.error(f'Scoring worker failed: {result}')
+            elif callback is not None:
+                try:
+                    callback(result)
+                except Exception:
+                    log.exception('Scoring callback failed')
+
+    def close(self):
+        """Stop all workers."""
+        for inbox in self.inboxes:
+            try:
+                inbox.put_nowait(None)
+            except queue.Full:
+                pass
+        for process in self.processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        self.outbox.put((None, None))
@@ -0,0 +1,122 @@
+"""VoidBot on an asyncio event loop.
+
+Handlers and commands may be coroutines, wiki calls are awaitable through
+bot.aioapis and scheduled jobs run as loop callbacks.
+Do not use without Void's permission
+"""
+
+import asyncio
+import logging
+import ssl
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from irc.client import Event
+from irc.client_aio import AioReactor
+from irc.connection import AioFactory
+from irc.schedule import IScheduler
+from voidbot import VoidBot
+from wiki.api import AioApi
+
+log = logging.getLogger(__name__)
+
+
+class LoopScheduler(IScheduler):
+    """Run scheduled jobs as event loop callbacks."""
+
+    def __init__(self, loop):
+        """Create a scheduler for :loop:."""
+        self.loop = loop
+
+    @staticmethod
+    def _seconds(delay):
+        return delay.total_seconds() if hasattr(delay, 'total_seconds') else delay
+
+    def execute_every(self, period, func):
+        """Run :func: every :period: seconds."""
+        period = self._seconds(period)
+
+        def tick():
+            self.loop.call_later(period, tick)  # Reschedule first, so a failing job keeps running
+            func()
+        self.loop.call_later(period, tick)
+
+    def execute_at(self, when, func):
+        """Run :func: at datetime :when:."""
+        now = datetime.now(when.tzinfo)
+        self.loop.call_later(max(0, (when - now).total_seconds()), func)
+
+    def execute_after(self, delay, func):
+        """Run :func: after :delay: seconds."""
+        self.loop.call_later(self._seconds(delay), func)
+
+    def run_pending(self):
+        """Nothing to do, the loop runs jobs when they are due."""
+        pass
+
+
+class LoopReactor(AioReactor):
+    """An AioReactor with a scheduler, as the rest of the bot expects."""
+
+    def __init__(self, *args, loop=None, **kwargs):
+        """Create a reactor on :loop:, or on a new loop."""
+        if loop is None:
+            loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(loop)
+        super().__init__(*args, loop=loop, **kwargs)
+        self.scheduler = LoopScheduler(self.loop)
+
+
+class AioVoidBot(VoidBot):
+    """A VoidBot running on asyncio."""
+
+    reactor_class = LoopReactor
+
+    def __init__(self, password, **kwargs):
+        """Create an AioVoidBot.
+
+        :param password: (string) NickServ password
+        :param kwargs: Passed on to VoidBot, such as server, name and shared
+        """
+        self.tasks = set()
+        self.executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix='voidbot')
+        super().__init__(password, **kwargs)
+        self.aioapis = {name: AioApi(api, self.executor) for name, api in self.apis.items()}
+
+    def connect_factory(self):
+        """Return the factory used to open connections."""
+        return AioFactory(ssl=ssl.create_default_context())
+
+    def _connect(self):
+        """Connect to the next server without blocking the loop."""
+        self.spawn(self._connect_async(self.servers.peek()))
+
+    async def _connect_async(self, server):
+        try:
+            await self.connection.connect(
+                server.host,
+                server.port,
+                self._nickname,
+                server.password,
+                ircname=self._realname,
+                connect_factory=self.connect_factory()
+            )
+        except OSError as e:
+            log.warning(f'Could not connect to {server.host}: {e}')
+            self.connection._handle_event(Event('disconnect', server.host, '', [str(e)]))
+
+    def spawn(self, awaitable):
+        """Run a coroutine returned by a handler or command on the loop."""
+        task = asyncio.ensure_future(awaitable, loop=self.reactor.loop)
+        self.tasks.add(task)  # Keep a reference until it is done
+        task.add_done_callback(self._task_done)
+        return task
+
+    def _task_done(self, task):
+        self.tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            log.error('Coroutine handler failed', exc_info=task.exception())
+
+    async def run_blocking(self, func, *args):
+        """Run a blocking function, such as ML scoring, on the thread pool."""
+        return await self.reactor.loop.run_in_executor(self.executor, func, *args)
@@ -0,0 +1,129 @@
+"""Batch outgoing channel mode changes, kicks and joins.
+
+Do not use without Void's permission
+"""
+
+import logging
+from irc.client import ServerNotConnectedError
+
+log = logging.getLogger(__name__)
+
+
+class ModeBatcher:
+    """Pack mode changes and kicks into as few lines as the server allows.
+
+    Changes are queued per channel and flushed together after :delay:
+    seconds, using the MODES and TARGMAX limits from ISUPPORT.
+    """
+
+    max_line = 400  # Leave room for the prefix the server adds when relaying
+
+    def __init__(self, bot, delay=0.2):
+        """Create a batcher for the connection of :bot:."""
+        self.bot = bot
+        self.delay = delay
+        self.changes = {}
+        self.kicks = {}
+        self.scheduled = False
+
+    @property
+    def depth(self):
+        """Return the number of queued changes and kicks."""
+        return sum(map(len, self.changes.values())) + sum(map(len, self.kicks.values()))
+
+    def _limits(self):
+        """Return how many parameter modes and kick targets fit in one line."""
+        features = self.bot.connection.features
+        modes = getattr(features, 'modes', 3)
+        if type(modes) is not int:
+            modes = 12  # MODES without a value (parsed as True) means no limit
+        kicks = getattr(features, 'targmax', {}).get('KICK', 1)
+        if kicks is None:
+            kicks = 12  # An empty TARGMAX value means no limit
+        return modes, kicks
+
+    def join(self, channels):
+        """Join :channels: right away, with as many per JOIN line as the server allows."""
+        limit = getattr(self.bot.connection.features, 'targmax', {}).get('JOIN')
+        lines = []
+        for channel in channels:
+            if lines and (limit is None or len(lines[-1]) < limit) and len(','.join(lines[-1] + [channel])) + 5 <= self.max_line:
+                lines[-1].append(channel)
+            else:
+                lines.append([channel])
+        for line in lines:
+            self.bot.connection.send_raw(f'JOIN {",".join(line)}')
+
+    def _schedule(self):
+        if not self.scheduled:
+            self.scheduled = True
+            self.bot.reactor.scheduler.execute_after(self.delay, self.flush)
+
+    def _redundant(self, channel, change, argument):
+        """Check whether tracked channel state makes a change pointless."""
+        chan = self.bot.channels.get(channel)
+        if chan is None or change[1] not in 'ov' or argument is None:
+            return False
+        has = chan.is_oper(argument) if change[1] == 'o' else chan.is_voiced(argument)
+        return has == (change[0] == '+')
+
+    def mode(self, channel, change, argument=None):
+        """Queue a single mode change such as ('#chan', '+o', 'nick').
+
+        Repeated changes are dropped, and a change queued together with
+        its opposite cancels out.
+        """
+        queued = self.changes.setdefault(channel, {})
+        key = (change[1], argument)
+        previous = queued.get(key)
+        if previous is not None and previous != change[0]:
+            queued.pop(key)
+        elif not self._redundant(channel, change, argument):
+            queued[key] = change[0]
+            self._schedule()
+
+    def kick(self, channel, nick, comment=''):
+        """Queue a kick, sent after the mode changes of the channel."""
+        self.kicks.setdefault(channel, {})[nick] = comment
+        self._schedule()
+
+    def _mode_lines(self, channel, queued, limit):
+        """Build MODE parameter strings for the queued changes of a channel."""
+        lines = []
+        letters, args, count, sign = '', [], 0, None
+        for (mode, argument), change in queued.items():
+            length = len(channel) + len(letters) + sum(len(arg) + 1 for arg in args)
+            if argument is not None and (count >= limit or length + len(argument) + 8 > self.max_line):
+                lines.append(' '.join([letters] + args))
+                letters, args, count, sign = '', [], 0, None
+            if change != sign:
+                letters += change
+                sign = change
+            letters += mode
+            if argument is not None:
+                args.append(argument)
+                count += 1
+        if letters:
+            lines.append(' '.join([letters] + args))
+        return lines
+
+    def flush(self):
+        """Send everything queued."""
+        self.scheduled = False
+        changes, self.changes = self.changes, {}
+        kicks, self.kicks = self.kicks, {}
+        mode_limit, kick_limit = self._limits()
+        connection = self.bot.connection
+        try:
+            for channel, queued in changes.items():
+                for line in self._mode_lines(channel, queued, mode_limit):
+                    connection.mode(channel, line)
+            for channel, queued in kicks.items():
+                by_comment = {}
+                for nick, comment in queued.items():
+                    by_comment.setdefault(comment, []).append(nick)
+                for comment, nicks in by_comment.items():
+                    for i in range(0, len(nicks), kick_limit):
+                        connection.kick(channel, ','.join(nicks[i:i + kick_limit]), comment)
+        except ServerNotConnectedError:
+            log.warning('Dropped queued mode changes, not connected')
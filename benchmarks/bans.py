@@ -0,0 +1,76 @@
+"""Benchmark for the ban index.
+
+Run from the repository root with: python -m benchmarks.bans
+Builds an index of 10k masks and matches a stream of joins against it,
+comparing with a linear fnmatch scan over the same masks.
+"""
+
+import fnmatch
+import random
+import string
+import time
+from abuse.bans import BanIndex
+
+
+def word(rng, length):
+    return ''.join(rng.choice(string.ascii_lowercase) for _ in range(length))
+
+
+def make_masks(rng, count):
+    """A mix of cloak, IP, CIDR, domain wildcard and nick masks."""
+    masks = []
+    for i in range(count):
+        kind = i % 5
+        if kind == 0:
+            masks.append(f'*!*@user/{word(rng, 8)}')
+        elif kind == 1:
+            masks.append(f'*!*@198.51.{rng.randint(0, 255)}.{rng.randint(0, 255)}')
+        elif kind == 2:
+            masks.append(f'*!*@10.{rng.randint(0, 255)}.{rng.randint(0, 255)}.*')
+        elif kind == 3:
+            masks.append(f'*!~{word(rng, 4)}*@*.{word(rng, 6)}.com')
+        else:
+            masks.append(f'{word(rng, 6)}*!*@*')
+    return masks
+
+
+def make_joins(rng, count, masks):
+    """Joins that are mostly innocent, with some matching a ban."""
+    joins = []
+    for i in range(count):
+        nick = word(rng, 7)
+        if i % 50 == 0:
+            joins.append(f'{nick}!~u@198.51.{rng.randint(0, 255)}.{rng.randint(0, 255)}')
+        elif i % 3 == 0:
+            joins.append(f'{nick}!~{word(rng, 5)}@host{i}.{word(rng, 6)}.com')
+        else:
+            joins.append(f'{nick}!~{nick}@user/{word(rng, 8)}')
+    return joins
+
+
+def main(count=10000, joins=20000):
+    rng = random.Random(1)
+    masks = make_masks(rng, count)
+    sources = make_joins(rng, joins, masks)
+
+    begin = time.perf_counter()
+    index = BanIndex(masks)
+    build = time.perf_counter() - begin
+    index.match('warm!up@cache')  # Compile the wildcard regexes
+    begin = time.perf_counter()
+    hits = sum(index.match(source) is not None for source in sources)
+    indexed = time.perf_counter() - begin
+
+    sample = sources[:200]
+    begin = time.perf_counter()
+    for source in sample:
+        any(fnmatch.fnmatchcase(source.lower(), mask.lower()) for mask in masks)
+    linear = (time.perf_counter() - begin) / len(sample) * len(sources)
+
+    print(f'{count} masks indexed in {build * 1000:.0f}ms')
+    print(f'Index: {joins / indexed:,.0f} joins/s ({hits} matches)')
+    print(f'Linear fnmatch (estimated from {len(sample)} joins): {joins / linear:,.0f} joins/s')
+
+
+if __name__ == '__main__':
+    main()
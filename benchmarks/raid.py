@@ -0,0 +1,120 @@
+"""Replay benchmark for the raid detector.
+
+Run from the repository root with: python -m benchmarks.raid
+Replays an hour of normal joins, with IRCCloud and webchat users and a
+netsplit, followed by 1000-join raids and reports detection latency,
+false alarms, cost per join and memory use.
+"""
+
+import random
+import string
+import sys
+import time
+from abuse.raid import Netsplits, RaidDetector
+from irc.client import NickMask
+
+
+def word(rng, length):
+    return ''.join(rng.choice(string.ascii_lowercase) for _ in range(length))
+
+
+def user(rng):
+    """A user of a cloak, IRCCloud or a webchat, with whatever realname the client gives."""
+    nick = word(rng, rng.randint(4, 10))
+    kind = rng.random()
+    if kind < 0.3:
+        id = rng.randint(1000, 999999)
+        return NickMask.from_params(nick, f'{rng.choice("su")}id{id}', f'id-{id}.ealing.irccloud.com'), nick
+    if kind < 0.5:
+        ip = f'{rng.randint(1, 254)}.{rng.randint(1, 254)}.{rng.randint(1, 254)}.{rng.randint(1, 254)}'
+        return NickMask.from_params(f'Guest{rng.randint(10, 9999)}', '~' + nick[:6], f'gateway/web/ip.{ip}'), 'https://web.libera.chat'
+    return NickMask.from_params(nick, '~' + nick[:6], f'user/{nick}'), nick
+
+
+def background(rng, seconds=3600, gap=20, split=1800, lost=300):
+    """Normal traffic: a random user every :gap: seconds on average, and
+    :lost: users rejoining within a minute of a netsplit at :split: seconds.
+    """
+    now = 0.0
+    while now < seconds:
+        now += rng.expovariate(1 / gap)
+        if split is not None and now >= split:
+            users = [user(rng) for _ in range(lost)]
+            for source, realname in users:
+                yield split, source, realname, '*.net *.split'
+            for source, realname in users:
+                yield split + rng.uniform(5, 60), source, realname, None
+            split = None
+        source, realname = user(rng)
+        yield now, source, realname, None
+
+
+def clone_raid(rng, start, joins=1000, rate=10):
+    """Clones from a few hosts with numbered nicks, :rate: joins per second."""
+    for i in range(joins):
+        nick = f'guest{rng.randint(1000, 99999)}'
+        host = f'192.0.2.{rng.randint(1, 4)}'
+        yield start + i / rate, NickMask.from_params(nick, f'~u{rng.randint(1, 999)}', host), 'Guest', None
+
+
+def diverse_raid(rng, start, joins=1000, rate=3):
+    """Unrelated looking users, only the join rate gives them away."""
+    for i in range(joins):
+        nick = word(rng, rng.randint(5, 9))
+        yield start + i / rate, NickMask.from_params(nick, word(rng, 6), f'{word(rng, 8)}.example'), word(rng, 7), None
+
+
+def feed(detector, netsplits, when, source, realname, quit):
+    """Feed one event the way RaidHandler does, :quit: being the message of a QUIT."""
+    if quit is not None:
+        netsplits.quit(source.nick, quit, now=when)
+        return None
+    if netsplits.rejoining(source.nick, now=when):
+        return None
+    return detector.join(source, realname, now=when)
+
+
+def replay(name, normal, raid):
+    detector = RaidDetector()
+    netsplits = Netsplits()
+    false_alarms = 0
+    elapsed = 0.0
+    joins = 0
+    for event in sorted(normal, key=lambda event: event[0]):
+        begin = time.perf_counter()
+        if feed(detector, netsplits, *event) is not None:
+            false_alarms += 1
+        elapsed += time.perf_counter() - begin
+        joins += 1
+    raid = list(raid)
+    start = raid[0][0]
+    latency = None
+    for i, event in enumerate(raid):
+        when = event[0]
+        begin = time.perf_counter()
+        reason = feed(detector, netsplits, *event)
+        elapsed += time.perf_counter() - begin
+        joins += 1
+        if reason is not None and latency is None:
+            latency = (when - start, i + 1, reason)
+    keys = sum(len(sketch.counts) for sketch in detector.sketches.values())
+    print(f'{name}:')
+    print(f'  false alarms before raid: {false_alarms}')
+    if latency is None:
+        print('  raid not detected')
+    else:
+        print(f'  detected after {latency[0]:.1f}s and {latency[1]} joins ({latency[2]})')
+    print(f'  {elapsed / joins * 1e6:.1f}us per join over {joins} joins')
+    print(f'  {keys} sketch counters, {sys.getsizeof(detector.joins.counts)} bytes of rate buckets')
+
+
+def main():
+    rng = random.Random(1)
+    normal = list(background(rng))
+    end = normal[-1][0] + 5
+    replay('Clone raid (10 joins/s)', normal, clone_raid(rng, end))
+    replay('Diverse raid (3 joins/s)', normal, diverse_raid(rng, end))
+
+
+if __name__ == '__main__':
+    main()
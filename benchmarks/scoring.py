@@ -0,0 +1,98 @@
+"""Benchmark for multi-core message scoring.
+
+Run from the repository root with: python -m benchmarks.scoring
+Trains on abuse/dataset.csv (or a synthetic set if it is missing), then
+scores a message stream in-process and with 1..N worker processes.
+"""
+
+import os
+import random
+import string
+import sys
+import tempfile
+import threading
+import time
+from abuse import ml, workers
+
+
+def word(rng, length):
+    return ''.join(rng.choice(string.ascii_lowercase) for _ in range(length))
+
+
+def make_dataset(rng, path, count=5000):
+    """Write a synthetic dataset where a few words mark abuse."""
+    vocabulary = [word(rng, rng.randint(3, 9)) for _ in range(3000)]
+    bad = vocabulary[:50]
+    with open(path, 'w') as dataset:
+        dataset.write('text,abuse\n')
+        for _ in range(count):
+            words = rng.choices(vocabulary, k=rng.randint(3, 20))
+            abuse = rng.random() < 0.2
+            if abuse:
+                words += rng.choices(bad, k=2)
+            dataset.write(f'{" ".join(words)},{int(abuse)}\n')
+    return vocabulary
+
+
+def run_pool(pool, messages):
+    """Score every message through :pool: and wait for all results."""
+    done = threading.Event()
+    left = [len(messages)]
+    lock = threading.Lock()
+
+    def callback(result):
+        with lock:
+            left[0] -= 1
+            if not left[0]:
+                done.set()
+
+    begin = time.perf_counter()
+    for message in messages:
+        while not pool.submit(message, callback):
+            time.sleep(0.0005)  # Queues full, let the workers catch up
+    done.wait()
+    return time.perf_counter() - begin
+
+
+def main(count=20000):
+    rng = random.Random(1)
+    workdir = tempfile.mkdtemp()
+    path = 'abuse/dataset.csv'
+    if os.path.exists(path):
+        vocabulary = None
+    else:
+        path = os.path.join(workdir, 'dataset.csv')
+        vocabulary = make_dataset(rng, path)
+    vectorizer, classifier, classifier2 = ml.train(path)
+    if vocabulary is None:
+        vocabulary = list(vectorizer.vocabulary_)
+    messages = [' '.join(rng.choices(vocabulary, k=rng.randint(3, 30))) for _ in range(count)]
+
+    begin = time.perf_counter()
+    for message in messages:
+        workers.score(vectorizer, classifier, classifier2, message)
+    elapsed = time.perf_counter() - begin
+    print(f'in-process:  {count / elapsed:9.0f} msg/s')
+
+    model = os.path.join(workdir, 'model')
+    workers.export_model(vectorizer, classifier, classifier2, model)
+    mapped = workers.MappedModel(model)
+    checked = messages[:500] + [  # Half with words the model does not know, some extending known ones
+        f'{m} {word(rng, 12)} {rng.choice(vocabulary)}s {rng.choice(vocabulary)}mer' for m in messages[500:1000]
+    ]
+    mismatches = sum(
+        workers.score(vectorizer, classifier, classifier2, m)[::2] != mapped.score(m)[::2]
+        for m in checked
+    )
+    print(f'mapped model disagrees on {mismatches}/{len(checked)} verdicts')
+
+    for cores in range(1, (int(sys.argv[1]) if len(sys.argv) > 1 else os.cpu_count()) + 1):
+        pool = workers.ScoringPool(model, workers=cores, queue_size=256)
+        run_pool(pool, messages[:500])  # Let the workers start up
+        elapsed = run_pool(pool, messages)
+        pool.close()
+        print(f'{cores:2} workers:  {count / elapsed:9.0f} msg/s')
+
+
+if __name__ == '__main__':
+    main()
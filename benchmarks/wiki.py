@@ -0,0 +1,93 @@
+"""Benchmark for wiki.api against a local stand-in.
+
+Run from the repository root with: python -m benchmarks.wiki [latency]
+Serves a wiki.standin with :latency: seconds per request (0.02 by
+default), then measures Logger.run, bulk page reads and BulkBlock
+throughput, once against a healthy wiki and once with maxlag,
+ratelimited, badtoken and HTTP 503 errors injected. Every injected
+error can be retried, so every block must succeed in both runs.
+"""
+
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from wiki.api import Api, Scheduler
+from wiki.helpers import BulkBlock, Logger
+from wiki.standin import StandIn
+
+faults = {'maxlag': 0.05, 'ratelimited': 0.02, 'badtoken': 0.02, 'http-503': 0.02}
+
+
+def make_api(standin, hostname, concurrency=2):
+    """An Api talking to :standin: through a fresh scheduler with short backoffs."""
+    Scheduler.schedulers[hostname] = Scheduler(hostname, concurrency, retries=5, backoff=0.01, max_backoff=0.1)
+    return Api(hostname, hostname, base_url=standin.base_url, auth=False)
+
+
+def percentiles(latencies):
+    latencies = sorted(latencies)
+    return latencies[len(latencies) // 2] * 1000, latencies[int(len(latencies) * 0.95)] * 1000
+
+
+def bench_logger(standin, count):
+    """Log :count: entries one after another, as commands.py does."""
+    api = make_api(standin, 'logger.standin')
+    standin.pages['Log'] = '== Log ==\n'
+    latencies = []
+    begin = time.perf_counter()
+    for i in range(count):
+        start = time.perf_counter()
+        Logger(api, 'Log', '== Log ==', 'bench', f'* entry {i}').run()
+        latencies.append(time.perf_counter() - start)
+    elapsed = time.perf_counter() - begin
+    logged = standin.pages['Log'].count('* entry ')
+    p50, p95 = percentiles(latencies)
+    print(f'  Logger.run:  {count / elapsed:7.1f} logs/s, {p50:.1f}ms p50 / {p95:.1f}ms p95 ({logged}/{count} logged)')
+
+
+def bench_reads(standin, count, concurrency):
+    """Read :count: pages from a thread pool, the scheduler allowing :concurrency: at once."""
+    api = make_api(standin, f'reads{concurrency}.standin', concurrency)
+    titles = [f'Page {i % 50}' for i in range(count)]
+    for title in titles[:50]:
+        standin.pages[title] = f'Content of {title}\n' * 20
+    begin = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        read = sum(1 for _ in pool.map(api.page, titles))
+    elapsed = time.perf_counter() - begin
+    print(f'  page reads:  {read / elapsed:7.1f} reads/s with {concurrency} in flight')
+
+
+def bench_blocks(standin, wikis, targets, global_block=False):
+    """Block :targets: users on :wikis: stand-in wikis at once."""
+    apis = {f'wiki{i}': make_api(standin, f'blocks{i}.standin') for i in range(wikis)}
+    users = [f'Vandal {i}' for i in range(targets)]
+    begin = time.perf_counter()
+    results = BulkBlock(apis, users, 'Benchmark', global_block=global_block, workers=16).run()
+    elapsed = time.perf_counter() - begin
+    failed = sum(not result.ok for result in results)
+    p50, p95 = percentiles([result.elapsed for result in results])
+    name = 'global blocks' if global_block else 'blocks'
+    print(f'  {name + ":":13}{len(results) / elapsed:7.1f} {name}/s over {wikis} wikis,'
+          f' {p50:.1f}ms p50 / {p95:.1f}ms p95')
+    assert not failed, [result.error for result in results if not result.ok]  # Errors are injected, all must be retried
+
+
+def main(latency=0.02, count=200):
+    for label, errors in (('healthy', {}), ('faulty', faults)):
+        standin = StandIn(latency=latency, errors=errors, retry_after=0, seed=1)
+        standin.start()
+        print(f'{label} wiki, {latency * 1000:.0f}ms per request')
+        bench_logger(standin, count // 4)
+        bench_reads(standin, count, 2)
+        bench_reads(standin, count, 8)
+        bench_blocks(standin, 4, count // 4)
+        bench_blocks(standin, 4, count // 4, global_block=True)
+        retried = sum(scheduler.retried for host, scheduler in Scheduler.schedulers.items() if host.endswith('.standin'))
+        print(f'  {sum(standin.stats()["requests"].values())} requests, {retried} retried,'
+              f' injected {standin.stats()["injected"] or "nothing"}')
+        standin.stop()
+
+
+if __name__ == '__main__':
+    main(float(sys.argv[1]) if len(sys.argv) > 1 else 0.02)
@@ -3,6 +3,9 @@
 Do not use without Void's permission
 """
 
+import inspect
+import time
+
 
 class Command:
     """A class representing a command.
@@ -79,7 +82,14 @@ class CommandHandler:
         """Run the command handler."""
         command = self.find_command()
         if command is not False and command.allowed(self.perm_level()):
-            command.action(self.bot, self.event)
+            self.bot.command_count.inc(self.bot.label, command.name)
+            begin = time.perf_counter()
+            try:
+                result = command.action(self.bot, self.event)
+            finally:
+                self.bot.profiler.record(command.prefix + command.name, time.perf_counter() - begin)
+            if inspect.isawaitable(result):
+                self.bot.spawn(result)
 
     @classmethod
     def enable_command(cls, command_name):
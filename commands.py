@@ -6,8 +6,9 @@ Do not use without Void's permission
 import logging
 import sys
 from datetime import datetime
-from wiki.api import ApiError, ConnectionError
+from wiki.api import Api, ApiError, ConnectionError, Scheduler
 from wiki.helpers import Logger
+from wiki.instrument import Instrumentation
 from command import Command, CommandHandler
 
 logs = logging.getLogger(__name__)
@@ -212,3 +213,117 @@ def ping(bot, event):
 
 help_str = "Debug only. Please don't play with this!"
 CommandHandler.commands.append(Command('ping', ping, restriction=Command.DEVELOPER, help=help_str))
+
+
+def wikiqueue(bot, event):
+    """Report wiki request scheduler state."""
+    target = event.target if event.type == 'pubmsg' else event.source.nick
+    names = {Scheduler.URGENT: 'urgent', Scheduler.WRITE: 'write', Scheduler.READ: 'read'}
+    for hostname, scheduler in sorted(Scheduler.schedulers.items()):
+        stats = scheduler.stats()
+        waits = ', '.join(
+            f'{names[priority]} {count} (avg {mean:.2f}s, max {longest:.2f}s)'
+            for priority, (count, mean, longest) in stats['waits'].items()
+        )
+        bot.connection.privmsg(target, f'{hostname}: {stats["depth"]} queued, {stats["active"]} active; {waits}')
+
+
+help_str = 'Report queue depth and wait times of wiki requests. (Requires Trusted)'
+CommandHandler.commands.append(Command('wikiqueue', wikiqueue, restriction=Command.TRUSTED, help=help_str))
+
+
+def wikistats(bot, event):
+    """Report or manage wiki call instrumentation."""
+    target = event.target if event.type == 'pubmsg' else event.source.nick
+    args = event.arguments[0].split()[1:]
+    if len(args) > 0 and args[0] == 'enable':
+        if Api.instrument is None:
+            Api.instrument = Instrumentation()
+        bot.saves['wiki_instrument'] = True
+        return bot.connection.privmsg(target, 'Wiki instrumentation is enabled.')
+    if len(args) > 0 and args[0] == 'disable':
+        Api.instrument = None
+        bot.saves['wiki_instrument'] = False
+        return bot.connection.privmsg(target, 'Wiki instrumentation is disabled.')
+    if Api.instrument is None:
+        return bot.connection.privmsg(target, 'Wiki instrumentation is disabled. Use $wikistats enable')
+    if len(args) > 0 and args[0] == 'dump':
+        Api.instrument.export(bot.path / 'wikistats.json')
+        return bot.connection.privmsg(target, 'Wrote wikistats.json')
+    lines = Api.instrument.summary(args[0] if len(args) > 0 else None)
+    if len(lines) == 0:
+        return bot.connection.privmsg(target, 'No wiki calls recorded yet.')
+    for line in lines:
+        bot.connection.privmsg(target, line)
+
+
+help_str = 'Report latency, sizes and errors of wiki calls. Command format is $wikistats [enable|disable|dump|hostname] (Requires Trusted)'
+CommandHandler.commands.append(Command('wikistats', wikistats, restriction=Command.TRUSTED, help=help_str))
+
+
+def stats(bot, event):
+    """Report where the bot spends its time."""
+    target = event.target if event.type == 'pubmsg' else event.source.nick
+    args = event.arguments[0].split()[1:]
+    if len(args) > 0 and args[0] == 'reset':
+        bot.profiler.reset()
+        return bot.connection.privmsg(target, 'Profiler statistics cleared.')
+    lines = bot.profiler.summary(args[0] if len(args) > 0 else '')
+    if len(lines) == 0:
+        return bot.connection.privmsg(target, 'Nothing recorded yet.')
+    since = datetime.fromtimestamp(bot.profiler.since).strftime('%Y-%m-%d %H:%M:%S')
+    bot.connection.privmsg(target, f'Busiest handlers and commands since {since}:')
+    for line in lines:
+        bot.connection.privmsg(target, line)
+
+
+help_str = 'Report call counts and latency of handlers and commands. Command format is $stats [reset|prefix] (Requires Developer)'
+CommandHandler.commands.append(Command('stats', stats, restriction=Command.DEVELOPER, help=help_str))
+
+
+def profile(bot, event):
+    """Run cProfile for a while and dump the result to a file."""
+    target = event.target if event.type == 'pubmsg' else event.source.nick
+    args = event.arguments[0].split()[1:]
+    try:
+        seconds = int(args[0]) if len(args) > 0 else 30
+    except ValueError:
+        return bot.connection.privmsg(target, 'Command format is $profile [seconds]')
+    seconds = max(1, min(seconds, 600))
+    path = bot.path / f'profile-{datetime.now().strftime("%Y%m%d-%H%M%S")}.prof'
+    if not bot.profiler.start_capture(path):
+        return bot.connection.privmsg(target, 'A capture is already running.')
+
+    def done():
+        written = bot.profiler.stop_capture()
+        bot.connection.privmsg(target, f'Wrote {written.name}, inspect it with python -m pstats')
+
+    bot.reactor.scheduler.execute_after(seconds, done)  # Runs on the reactor thread, like this command
+    bot.connection.privmsg(target, f'Profiling for {seconds} seconds.')
+
+
+help_str = 'Profile the bot with cProfile. Command format is $profile [seconds] (Requires Developer)'
+CommandHandler.commands.append(Command('profile', profile, restriction=Command.DEVELOPER, help=help_str))
+
+
+def recent(bot, event):
+    """Show the latest messages of a user, privately."""
+    sender = event.source.nick
+    args = event.arguments[0].split()[1:]
+    if len(args) == 0:
+        return bot.connection.privmsg(sender, 'Command format is $recent <nick> [count]')
+    nick = args[0]
+    count = min(int(args[1]), 8) if len(args) > 1 and args[1].isdigit() else 5
+    found = bot.history.by_nick(nick, limit=count)
+    userhost = bot.hosts.get(nick)
+    if len(found) == 0 and userhost is not None:
+        found = bot.history.by_host(userhost.split('@')[-1], limit=count)  # Messages sent under an earlier nick
+    if len(found) == 0:
+        return bot.connection.privmsg(sender, f'No recent messages from {nick}.')
+    for channel, record in reversed(found):
+        when = datetime.fromtimestamp(record.time).strftime('%H:%M:%S')
+        bot.connection.privmsg(sender, f'[{when}] {channel} <{record.nick}> {record.text}')
+
+
+help_str = 'Show the latest messages of a user (8 at most), in private. Command format is $recent <nick> [count] (Requires Trusted)'
+CommandHandler.commands.append(Command('recent', recent, restriction=Command.TRUSTED, help=help_str))
@@ -3,13 +3,15 @@
 Want to be able to reload event handlers as needed
 """
 
+import inspect
 import logging
 import irc.modes
+import irc.strings
 import threading
 import time
 
 from command import Command, CommandHandler
-from abuse import ml  #, heuristics
+from abuse import heuristics, ml, normalize, raid, workers
 
 log = logging.getLogger(__name__)
 
@@ -23,18 +25,85 @@ class Handler():
         self.skip_events = []
         self.commands = []
 
-    def _ignore(self, *args):
-        pass
-
     def run(self, connection, event):
-        """Run on events we have methods for."""
+        """Run on events we have methods for.
+
+        Time spent is recorded in the bot's profiler; for coroutine handlers
+        that only covers the part before they first wait.
+        """
         if event.type not in self.skip_events:
-            getattr(self, f'on_{event.type}', self._ignore)(connection, event)
+            method = getattr(self, f'on_{event.type}', None)
+            if method is None:
+                return
+            begin = time.perf_counter()
+            try:
+                result = method(connection, event)
+            finally:
+                self.bot.profiler.record(f'{type(self).__name__}.on_{event.type}', time.perf_counter() - begin)
+            if inspect.isawaitable(result):
+                self.bot.spawn(result)
+
+    def export_state(self):
+        """Return the state to carry over to the handler replacing this one on reload."""
+        return {}
+
+    def import_state(self, state):
+        """Take over :state: exported by the handler this one replaces."""
+        pass
+
+    def rebase_state(self, state, offset):
+        """Return :state: from a snapshot with its time.monotonic() stamps moved by :offset: seconds.
+
+        The monotonic clock of the process that wrote the snapshot has
+        another epoch, after a reboot even one of a different sign.
+        """
+        return state
 
     def load_commands(self):
-        """Load in registered commands."""
+        """Load in registered commands.
+
+        Commands are routed to the handler of the bot that received them,
+        so bots on several networks can share one command list. Commands
+        of an earlier version of this handler are replaced, keeping
+        whether they were disabled. Commands named like one that is not
+        this handler's are skipped with a warning.
+        """
+        name = type(self).__name__
         for command in self.commands:
-            CommandHandler.commands.append(command)
+            old = CommandHandler.get_command(command.name)
+            if old is not False and getattr(old.action, 'handler', None) == name:
+                command.enabled = old.enabled
+                CommandHandler.commands.remove(old)
+                old = False
+            if old is False:
+                command.action = self._route(command.action.__name__)
+                CommandHandler.commands.append(command)
+            else:
+                owner = getattr(old.action, 'handler', None) or old.action.__module__
+                log.warning(f'{name} command "{command.name}" not loaded, {owner} already has one')
+
+    @classmethod
+    def of(cls, bot):
+        """Return the handler of this class used by :bot:.
+
+        Handlers are matched by class name, so handlers created before
+        and after a reload of this module find each other.
+        """
+        for handler in bot.handlers:
+            if type(handler).__name__ == cls.__name__:
+                return handler
+        return None
+
+    @classmethod
+    def _route(cls, name):
+        """Return an action calling method :name: of the bot's own handler."""
+        def action(bot, event):
+            handler = cls.of(bot)
+            if handler is not None:
+                return getattr(handler, name)(bot, event)
+        action.__name__ = name
+        action.handler = cls.__name__
+        return action
 
 
 class Lockdown(Handler):
@@ -46,9 +115,8 @@ class Lockdown(Handler):
         """Lockdown handler."""
         super().__init__(bot)
         self.locked_down = bot.saves.setdefault('locked_down', [])
-        self.pending = {}
-        self.pending_users = {}
         self.auto = bot.saves.setdefault('lock_auto', False)
+        self.lockdowns = bot.metrics.counter('voidbot_lockdowns_total', 'Lockdowns enabled.', ('network', 'channel'))
         self.commands.append(Command(
             'lockdown',
             self.lockdown_cmd,
@@ -113,8 +181,7 @@ class Lockdown(Handler):
         if self.bot.channels[channel].is_oper(connection.get_nickname()):
             self.do_lockdown(connection, channel)
         else:
-            self.pending[channel] = self.do_lockdown
-            connection.privmsg('ChanServ', f'OP {channel} {connection.get_nickname()}')
+            self.bot.pending.need_op(channel, 'lockdown', self.do_lockdown)
 
     def do_lockdown(self, connection, chan):
         """Do lockdown procedure."""
@@ -122,32 +189,48 @@ class Lockdown(Handler):
             self.locked_down.append(chan)
         else:
             log.warn(f'Enabling lockdown in {chan} despite channel appearing locked down?')
+        self.lockdowns.inc(self.bot.label, chan)
+        self.apply_lockdown(connection, chan)
+
+    def apply_lockdown(self, connection, chan):
+        """Set lockdown modes and op trusted users."""
         channel = self.bot.channels[chan]
-        connection.mode(chan, '+qz *!*@*')
+        self.bot.modes.mode(chan, '+q', '*!*@*')
+        self.bot.modes.mode(chan, '+z')
+        unknown = []
         for user in channel.users():
             if user in [connection.get_nickname(), 'ChanServ']:
                 continue
-            if chan not in self.pending_users:
-                self.pending_users[chan] = []
-            self.pending_users[chan].append(user)
-            connection.userhost([user])
+            host = self.bot.hosts.host(user)
+            if host is None:
+                unknown.append(user)
+            elif chan in self.bot.trusted.get('op', {}).get(host, []):
+                self.bot.modes.mode(chan, '+o', user)
+        if len(unknown) > 0:
+            self.bot.pending.add_users(chan, unknown)
+            for i in range(0, len(unknown), 5):  # USERHOST takes up to 5 nicks
+                connection.userhost(unknown[i:i + 5])
 
     def on_userhost(self, connection, event):
         """Grant ops to trusted users."""
-        user = event.arguments[0].split('=')[0].strip(' *')
-        host = event.arguments[0].split('@')[-1].strip()
-        for chan in self.pending_users:
-            if user in self.pending_users[chan]:
+        for reply in event.arguments[0].split():
+            user, _, userhost = reply.partition('=')
+            user = user.rstrip('*')
+            userhost = userhost[1:]  # Drop away status
+            self.bot.hosts.set(user, userhost)
+            host = userhost.split('@')[-1]
+            for chan in self.bot.pending.take_user(user):
                 if chan in self.bot.trusted.get('op', {}).get(host, []):
-                    connection.mode(chan, '+o ' + user)
+                    self.bot.modes.mode(chan, '+o', user)
 
     def on_join(self, connection, event):
-        """Grant ops to trusted users when they join."""
+        """Grant ops to trusted users when they join, restore lockdowns when we (re)join."""
         if event.target in self.locked_down:
-            if event.source == connection.get_nickname():
-                connection.privmsg('ChanServ', f'OP {event.target} {connection.get_nickname()}')
+            if event.source.nick == connection.get_nickname():
+                self.bot.pending.need_op(event.target, 'restore', self.apply_lockdown)
+                return
             if event.target in self.bot.trusted.get('op', {}).get(event.source.host, []):
-                connection.mode(event.target, '+o ' + event.source.nick)
+                self.bot.modes.mode(event.target, '+o', event.source.nick)
 
     def pre_unlock(self, connection, channel):
         """Pre unlock checks."""
@@ -157,8 +240,7 @@ class Lockdown(Handler):
         if self.bot.channels[channel].is_oper(connection.get_nickname()):
             self.drop_lockdown(connection, channel)
         else:
-            self.pending[channel] = self.drop_lockdown
-            connection.privmsg('ChanServ', f'OP {channel} {connection.get_nickname()}')
+            self.bot.pending.need_op(channel, 'lockdown', self.drop_lockdown)
 
     def drop_lockdown(self, connection, chan):
         """Drop lockdown."""
@@ -167,18 +249,11 @@ class Lockdown(Handler):
         else:
             log.warn(f'Removing lockdown from {chan} despite no lockdown in place?')
         # channel = self.bot.channels[chan]
-        connection.mode(chan, '-q *!*@*')
+        self.bot.modes.mode(chan, '-q', '*!*@*')
         # TODO: DEOP OPS?
 
     def on_mode(self, connection, event):
         """Handle various mode changes."""
-        if event.target in self.pending:
-            modes = irc.modes.parse_channel_modes(' '.join(event.arguments))
-            for mode in modes:
-                # TODO: verify
-                if mode == ['+', 'o', connection.get_nickname()]:
-                    self.pending[event.target](connection, event.target)
-                    self.pending.pop(event.target)
         if self.auto:
             self.on_mode_auto(connection, event)
 
@@ -199,138 +274,364 @@ class Lockdown(Handler):
                     break
 
 
+def remember(bot, event):
+    """Add message :event: to bot.history, only the first time it is asked for."""
+    if not getattr(event, 'remembered', False):
+        bot.history.add(event.target, event.source, normalize.of(event).text)
+        event.remembered = True
+
+
+class HostTracker(Handler):
+    """Keep bot.hosts and bot.history up to date from channel events."""
+
+    def _forget(self, nick):
+        """Forget a nick once it shares no channel with us."""
+        for channel in self.bot.channels.values():
+            if channel.has_user(nick):
+                return
+        self.bot.hosts.remove(nick)
+
+    def on_join(self, connection, event):
+        """Learn hosts of joining users, or of everyone in a channel we join."""
+        if event.source.nick == connection.get_nickname():
+            connection.who(event.target)
+        else:
+            self.bot.hosts.set(event.source.nick, event.source.userhost)
+
+    def on_whoreply(self, connection, event):
+        """Learn hosts from WHO."""
+        channel, user, host, server, nick = event.arguments[:5]
+        self.bot.hosts.set(nick, f'{user}@{host}')
+
+    def on_nick(self, connection, event):
+        """Follow nick changes."""
+        self.bot.hosts.rename(event.source.nick, event.target)
+        self.bot.hosts.set(event.target, event.source.userhost)
+
+    def on_pubmsg(self, connection, event):
+        """Keep hosts of active users fresh, and remember the message."""
+        self.bot.hosts.set(event.source.nick, event.source.userhost)
+        remember(self.bot, event)
+
+    def on_part(self, connection, event):
+        """Forget parting users."""
+        if event.source.nick == connection.get_nickname():
+            self.bot.history.remove(event.target)
+            for nick in list(self.bot.hosts.hosts):
+                self._forget(nick)
+        else:
+            self._forget(event.source.nick)
+
+    def on_kick(self, connection, event):
+        """Forget kicked users."""
+        if event.arguments[0] == connection.get_nickname():
+            self.bot.history.remove(event.target)
+            for nick in list(self.bot.hosts.hosts):
+                self._forget(nick)
+        else:
+            self._forget(event.arguments[0])
+
+    def on_quit(self, connection, event):
+        """Forget quitting users."""
+        self.bot.hosts.remove(event.source.nick)
+
+    def on_disconnect(self, connection, event):
+        """Forget everyone, we will WHO again on join."""
+        self.bot.hosts.clear()
+
+
+class BanHandler(Handler):
+    """Report banned users joining moderated channels."""
+
+    def on_join(self, connection, event):
+        """Match joining users against the ban list."""
+        if event.target not in Lockdown.can_moderate:
+            return
+        mask = self.bot.bans.match(event.source)
+        if mask is not None:
+            log.warn(f'Banned user "{event.source}" joined {event.target} (matches "{mask}")')
+
+
+class RaidHandler(Handler):
+    """Detect join floods and lock channels down."""
+
+    def __init__(self, bot):
+        """Raid handler."""
+        super().__init__(bot)
+        self.detectors = {}
+        self.netsplits = raid.Netsplits()
+
+    def export_state(self):
+        """Keep join windows across reloads."""
+        return {'detectors': self.detectors, 'netsplits': self.netsplits}
+
+    def import_state(self, state):
+        """Take over join windows."""
+        self.detectors = state.get('detectors', self.detectors)
+        self.netsplits = state.get('netsplits', self.netsplits)
+
+    def rebase_state(self, state, offset):
+        """Move the join windows and cooldowns of the detectors to our clock."""
+        for detector in state.get('detectors', {}).values():
+            detector.rebase(offset)
+        if 'netsplits' in state:
+            state['netsplits'].rebase(offset)
+        return state
+
+    def on_quit(self, connection, event):
+        """Remember users lost in a netsplit."""
+        if event.arguments:
+            self.netsplits.quit(event.source.nick, event.arguments[0])
+
+    def on_join(self, connection, event):
+        """Feed joins to the channel's detector."""
+        if event.source.nick == connection.get_nickname():
+            return
+        channel = event.target
+        if channel not in Lockdown.can_moderate or self.netsplits.rejoining(event.source.nick):
+            return
+        detector = self.detectors.get(channel)
+        if detector is None:
+            detector = self.detectors[channel] = raid.RaidDetector()
+        realname = event.arguments[1] if len(event.arguments) > 1 else None  # extended-join
+        reason = detector.join(event.source, realname)
+        if reason is None:
+            return
+        lockdown = Lockdown.of(self.bot)
+        if lockdown is None or not lockdown.auto:
+            log.warn(f'Possible raid in {channel}: {reason}')
+        elif channel not in lockdown.locked_down:
+            log.warn(f'Locking down {channel} for possible raid: {reason}')
+            lockdown.pre_lockdown(connection, channel)
+
+
 class MLHandler(Handler):
     """Implement machine learning abuse detection."""
 
     def __init__(self, bot):
         """Initialize needed stuff."""
         super().__init__(bot)
-        self.pending_bans = {}
-        # Store values in bot to avoid retraining every reload
-        self.vectorizer = getattr(bot, 'vectorizer', False)
-        self.classifier = getattr(bot, 'classifier', False)
-        self.classifier2 = getattr(bot, 'classifier2', False)
-        self.heuristics = []
-        self.timestamps = {}
+        self.heuristics = heuristics.RuleSet(bot.path / 'abuse/heuristics.json')
+        self.tripped = {}  # Lowered nick -> time flooding was last detected
         self.mutex = threading.RLock()
+        self.verdicts = bot.metrics.counter('voidbot_ml_verdicts_total', 'Messages judged by the classifiers.', ('network', 'classifier', 'verdict'))
+        self.floods = bot.metrics.counter('voidbot_floods_total', 'Flood detections.', ('network', 'channel'))
         self.commands.append(Command(
             'train',
             self.train,
             restriction=Command.DEVELOPER,
             help="(Re)train dataset (if you don't know what this means, don't touch it!)"
         ))
-        if not (self.vectorizer and self.classifier and self.classifier2):
-            t_thread = threading.Thread(target=self.train)
+        self.commands.append(Command(
+            'reloadrules',
+            self.reload_rules,
+            restriction=Command.DEVELOPER,
+            help='Reload heuristic rules from abuse/heuristics.json.'
+        ))
+        if not (self.vectorizer and self.classifier and self.classifier2) and not bot.shared.training:
+            bot.shared.training = True  # Before the thread starts, so other bots do not start their own
+            t_thread = threading.Thread(target=self.warm_start)
             t_thread.start()
+        elif self.classifier2 and bot.shared.scoring is None:
+            self.start_workers()
+
+    def export_state(self):
+        """Keep flood detections across reloads."""
+        return {'tripped': self.tripped}
+
+    def import_state(self, state):
+        """Take over flood detections."""
+        self.tripped = state.get('tripped', self.tripped)
+
+    # Stored in bot to avoid retraining every reload, and shared between networks
+    vectorizer = property(lambda self: self.bot.vectorizer)
+    classifier = property(lambda self: self.bot.classifier)
+    classifier2 = property(lambda self: self.bot.classifier2)
+
+    def warm_start(self):
+        """Load the saved models if they were fitted on the current dataset, else train."""
+        try:
+            dataset = self.bot.path / 'abuse/dataset.csv'
+            model_file = self.bot.shared.model_file or self.bot.path / 'abuse/model.pickle'
+            try:
+                models = ml.load_model(model_file, dataset)
+            except Exception:
+                log.exception(f'Could not load models from {model_file}, training instead')
+                models = None
+            if models is None:
+                return self.train()
+            log.info(f'Loaded models from {model_file}')
+            self.bot.shared.model_file = model_file
+            self.bot.vectorizer, self.bot.classifier, self.bot.classifier2 = models
+            self.start_workers()
+        finally:
+            self.bot.shared.training = False  # Whatever failed, the next MLHandler may try again
 
     def train(self, *args):
         """Load in vectorizer and classifier."""
-        vectorizer, classifier, classifier2 = ml.train(self.bot.path / 'abuse/dataset.csv')
-        # Store values in bot to avoid retraining every reload
-        self.bot.vectorizer = self.vectorizer = vectorizer
-        self.bot.classifier = self.classifier = classifier
-        self.bot.classifier2 = self.classifier2 = classifier2
-
-    def check_flood(self, nick):
-        """Attempt to determine if supplied nick is flooding."""
+        dataset = self.bot.path / 'abuse/dataset.csv'
+        self.bot.shared.training = True
+        try:
+            vectorizer, classifier, classifier2 = ml.train(dataset)
+        finally:
+            self.bot.shared.training = False
+        self.bot.vectorizer = vectorizer
+        self.bot.classifier = classifier
+        self.bot.classifier2 = classifier2
+        model_file = self.bot.path / 'abuse/model.pickle'
+        ml.save_model(model_file, (vectorizer, classifier, classifier2), dataset)  # For warm_start after a restart
+        self.bot.shared.model_file = model_file
+        self.start_workers()
+
+    def start_workers(self):
+        """Move scoring to worker processes if saves['ml_workers'] is set."""
+        count = self.bot.saves.get('ml_workers', 0)
+        if not count or not self.classifier2:
+            return
+        old = self.bot.shared.scoring
+        path = self.bot.path / 'abuse/model'
+        workers.export_model(self.vectorizer, self.classifier, self.classifier2, path)
+        self.bot.shared.scoring = workers.ScoringPool(path, workers=count)
+        if old is not None:
+            old.close()
+
+    def reload_rules(self, bot, event):
+        """Reload heuristic rules now."""
+        target = event.target if event.type == 'pubmsg' else event.source.nick
+        self.heuristics.mtime = None  # Force reload
+        if self.heuristics.reload():
+            bot.connection.privmsg(target, f'Loaded {len(self.heuristics.names)} heuristic rules.')
+        else:
+            bot.connection.privmsg(target, 'Could not load heuristic rules, see log.')
+
+    def check_flood(self, event):
+        """Attempt to determine if the sender of message :event: is flooding.
+
+        Reads the messages of the sender from bot.history, adding :event:
+        first unless HostTracker already did.
+        """
+        nick = event.source.nick
+        remember(self.bot, event)
         # TODO: replace with better whitelist (incorporate into heuristics points?)
         with self.mutex:
             if "Bot" in nick or "Not" in nick:
                 return False
-            if nick not in self.timestamps:
-                self.timestamps[nick] = [time.time()]
-                return False
             now = time.time()
-            timestamps = self.timestamps[nick]
-            for timestamp in timestamps.copy():
-                if now - timestamp > 30:
-                    # Ignore all timestamps older than 30s
-                    timestamps.remove(timestamp)
+            # Ignore all messages older than 30s, and those before the last trip
+            since = max(now - 30, self.tripped.get(irc.strings.lower(nick), 0))
+            records = self.bot.history.by_nick(nick, limit=32, since=since)
+            timestamps = [record.time for _, record in reversed(records[1:])]  # Oldest first, without this message
             total = len(timestamps)
             if total < 4:
-                self.timestamps[nick].append(now)
                 return False
             if total > 30:
-                self.timestamps.pop(nick)  # Don't trip repeatedly on the same user
+                self.tripped[irc.strings.lower(nick)] = now  # Don't trip repeatedly on the same user
                 return True  # Hard limit at 1msg/sec over 30s
             avg = (now - timestamps[0]) / (total + 1)  # A simpler system, 0 index should be oldest
             if -(2.4 / total) + 3 > avg:
-                self.timestamps.pop(nick)  # Don't trip repeatedly on the same user
+                self.tripped[irc.strings.lower(nick)] = now  # Don't trip repeatedly on the same user
                 return True  # I don't want to explain this math, so I hope it works
-            self.timestamps[nick].append(now)
             return False
 
     def _clean(self):
-        """Clear old entries from timestamps."""
+        """Clear old entries from tripped."""
         with self.mutex:
             now = time.time()
-            nicks = list(self.timestamps.keys())
-            for nick in nicks:
-                for timestamp in self.timestamps[nick].copy():
-                    if now - timestamp > 30:
-                        self.timestamps[nick].remove(timestamp)
-                if len(self.timestamps[nick]) == 0:
-                    self.timestamps.pop(nick)
+            for nick, tripped in list(self.tripped.items()):
+                if now - tripped > 30:
+                    self.tripped.pop(nick)
 
     def on_pubmsg(self, connection, event):
         """Process public messages for abuse."""
         if not(self.vectorizer and self.classifier):
             return
-        words = ' '.join(event.arguments)
-        wordbag = self.vectorizer.transform([words])
+        normalized = normalize.of(event)
+        words = normalized.raw
         c = event.target
+        recent = ()
+        if self.heuristics.window:
+            history = self.bot.history.get(c)
+            if history is not None:
+                recent = history.by_host(event.source.host, since=time.time() - self.heuristics.window)[1:]  # Skip this message
+        scores = self.heuristics.score(normalized, event.source.host, recent)
+        if sum(scores.values()) <= -1000:
+            return  # Whitelisted users
 
         # Flood detection
-        if self.check_flood(event.source.nick):
+        if self.check_flood(event):
             log.warn(f'Detected flooding from "{event.source.nick}" in {c}')
+            self.floods.inc(self.bot.label, c)
+
+        self._clean()  # Housekeeping
+
+        pool = self.bot.shared.scoring
+        if pool is not None and pool.submit(ml.process_text(normalized), lambda result: self.judged(connection, event, words, scores, result)):
+            return
+        self.judge(connection, event, words, scores, workers.score(self.vectorizer, self.classifier, self.classifier2, normalized))
+
+    def judged(self, connection, event, words, scores, result):
+        """Judge a message scored by a worker, from the collector thread."""
+        with self.bot.reactor.mutex:
+            self.judge(connection, event, words, scores, result)
+
+    def judge(self, connection, event, words, scores, result):
+        """Act on the classifier verdicts for a message."""
+        abusive, probability, abusive2 = result
+        c = event.target
+
+        self.verdicts.inc(self.bot.label, 'classifier1', 'abusive' if abusive else 'clean')
 
         # Classifier1
-        if self.classifier.predict(wordbag).tolist()[0]:
-            """Not ready for use
-            for rule in self.heuristics:
-                if rule.apply(event) <= -1000:
-                    return  # Whitelist users
-            """
+        if abusive:
             log.warn(f'Classifier1 detected abusive message: "{words}" from "{event.source}" in "{c}"')
             """Not ready for use
             channel = self.bot.channels[c]
-            if channel.is_oper(connection.get_nickname):
-                connection.mode(c, '+b ' + event.sender.host)
-                connection.kick(c, event.sender.nick)
+            if channel.is_oper(connection.get_nickname()):
+                self.ban_users(connection, c, event.source)
             else:
-                if c not in self.pending_bans:
-                    self.pending_bans[c] = []
-                self.pending_bans[c].append(event.sender)
-                connection.privmsg('ChanServ', f'OP {c} {connection.get_nickname()}')
+                self.bot.pending.need_op(c, 'bans', self.ban_users, event.source)
             """
 
         # Classifier2
-        points = self.classifier2.predict_proba(wordbag).tolist()[0][1]
-        points = int(points * 100)
-        for rule in self.heuristics:
-            points += rule.apply(event)
-        if points >= 95 or self.classifier2.predict(wordbag).tolist()[0]:
-            log.warn(f'Classifier2 tripped with score {points} on: "{words}" from "{event.source}" in "{c}"')
-
-        self._clean()  # Housekeeping
-
-    def on_mode(self, connection, event):
-        """Process pending bans."""
-        if event.target in self.pending_bans:
-            modes = irc.modes.parse_channel_modes(' '.join(event.arguments))
-            for mode in modes:
-                if mode == ['+', 'o', connection.get_nickname()]:
-                    for user in self.pending_bans[event.target]:
-                        connection.mode(event.target, '+b ' + user.host)
-                        connection.kick(event.target, user.nick)
-                    self.pending_bans.pop(event.target)
-
-
-def load_handlers(bot):
-    """Return an array of all in use handlers."""
+        points = int(probability * 100)
+        points += sum(scores.values())
+        tripped = points >= 95 or abusive2
+        self.verdicts.inc(self.bot.label, 'classifier2', 'tripped' if tripped else 'clean')
+        if tripped:
+            rules = ', '.join(f'{name} {value:+}' for name, value in scores.items()) or 'none'
+            log.warn(f'Classifier2 tripped with score {points} (rules: {rules}) on: "{words}" from "{event.source}" in "{c}"')
+
+    def ban_users(self, connection, channel, *users):
+        """Ban and kick abusive users."""
+        for user in users:
+            self.bot.modes.mode(channel, '+b', f'*!*@{user.host}')
+            self.bot.modes.kick(channel, user.nick)
+
+
+def load_handlers(bot, previous=(), only=None):
+    """Return an array of all in use handlers.
+
+    :param previous: (list) Handlers being replaced, their state is carried over
+    :param only: (list) Names of the handlers to replace, others in :previous: are kept
+    """
+    classes = []
+    classes.append(HostTracker)
+    classes.append(Lockdown)
+    classes.append(BanHandler)
+    classes.append(RaidHandler)
+    # classes.append(MLHandler)
+    old = {type(handler).__name__: handler for handler in previous}
     handlers = []
-    handlers.append(Lockdown(bot))
-    # handlers.append(MLHandler(bot))
-    for handler in handlers:
+    created = []
+    for cls in classes:
+        handler = old.get(cls.__name__)
+        if handler is None or only is None or cls.__name__ in only:
+            replaced = handler
+            handler = cls(bot)
+            if replaced is not None:
+                handler.import_state(replaced.export_state())
+            created.append(handler)
+        handlers.append(handler)
+    for handler in created:  # Only once every handler was created, so failures leave commands alone
         handler.load_commands()
     return handlers
@@ -0,0 +1,136 @@
+"""Remember recent channel messages.
+
+Do not use without Void's permission
+"""
+
+import sys
+import time
+
+from collections import deque, namedtuple
+from irc.dict import IRCDict
+from irc.strings import lower
+
+Record = namedtuple('Record', 'time nick host text')
+
+
+class ChannelHistory:
+    """A ring buffer of the last :size: messages of one channel.
+
+    Messages are indexed by nick and by host. Each index holds exactly the
+    messages still in the buffer, so nothing grows past :size: records.
+    """
+
+    def __init__(self, size=500, max_text=512):
+        """Create an empty history.
+
+        :param size: (int) Number of messages kept
+        :param max_text: (int) Longer messages are truncated
+        """
+        self.size = size
+        self.max_text = max_text
+        self.records = [None] * size
+        self.seq = 0  # Sequence number of the next message
+        self.nicks = {}  # lowered nick -> deque of sequence numbers, oldest first
+        self.hosts = {}
+
+    def __len__(self):
+        """Return the number of messages kept."""
+        return min(self.seq, self.size)
+
+    @staticmethod
+    def _drop(index, key):
+        """Remove the oldest entry of :key: in :index:."""
+        entries = index[key]
+        entries.popleft()
+        if not entries:
+            del index[key]
+
+    def add(self, nick, host, text, now=None):
+        """Remember a message, forgetting the oldest one when full."""
+        slot = self.seq % self.size
+        old = self.records[slot]
+        if old is not None:
+            self._drop(self.nicks, lower(old.nick))
+            self._drop(self.hosts, old.host)
+        nick = sys.intern(nick)
+        host = sys.intern(host)
+        self.records[slot] = Record(time.time() if now is None else now, nick, host, text[:self.max_text])
+        self.nicks.setdefault(lower(nick), deque()).append(self.seq)
+        self.hosts.setdefault(host, deque()).append(self.seq)
+        self.seq += 1
+
+    def _lookup(self, entries, limit, since):
+        """Return the records of :entries:, newest first."""
+        found = []
+        for seq in reversed(entries):
+            record = self.records[seq % self.size]
+            if since is not None and record.time < since:
+                break
+            found.append(record)
+            if len(found) == limit:
+                break
+        return found
+
+    def recent(self, limit=None, since=None):
+        """Return the latest messages, newest first."""
+        return self._lookup(range(max(0, self.seq - self.size), self.seq), limit, since)
+
+    def by_nick(self, nick, limit=None, since=None):
+        """Return the latest messages of :nick:, newest first."""
+        return self._lookup(self.nicks.get(lower(nick), ()), limit, since)
+
+    def by_host(self, host, limit=None, since=None):
+        """Return the latest messages from :host:, newest first."""
+        return self._lookup(self.hosts.get(host, ()), limit, since)
+
+
+class History:
+    """Message histories of every channel we are in."""
+
+    def __init__(self, size=500):
+        """Create empty histories of :size: messages per channel."""
+        self.size = size
+        self.channels = IRCDict()
+
+    def channel(self, channel):
+        """Return the ChannelHistory of :channel:, creating it if needed."""
+        history = self.channels.get(channel)
+        if history is None:
+            history = self.channels[channel] = ChannelHistory(self.size)
+        return history
+
+    def add(self, channel, source, text, now=None):
+        """Remember message :text: sent by NickMask :source: to :channel:."""
+        self.channel(channel).add(source.nick, source.host, text, now)
+
+    def get(self, channel):
+        """Return the ChannelHistory of :channel:, or None."""
+        return self.channels.get(channel)
+
+    def by_nick(self, nick, limit=None, since=None):
+        """Return (channel, record) of the latest messages of :nick: in any channel, newest first."""
+        found = [
+            (channel, record)
+            for channel, history in self.channels.items()
+            for record in history.by_nick(nick, limit, since)
+        ]
+        found.sort(key=lambda item: item[1].time, reverse=True)
+        return found[:limit]
+
+    def by_host(self, host, limit=None, since=None):
+        """Return (channel, record) of the latest messages from :host: in any channel, newest first."""
+        found = [
+            (channel, record)
+            for channel, history in self.channels.items()
+            for record in history.by_host(host, limit, since)
+        ]
+        found.sort(key=lambda item: item[1].time, reverse=True)
+        return found[:limit]
+
+    def remove(self, channel):
+        """Forget :channel:, when we leave it."""
+        self.channels.pop(channel, None)
+
+    def clear(self):
+        """Forget everything."""
+        self.channels.clear()
@@ -0,0 +1,236 @@
+"""Metrics about the bot in the Prometheus text format.
+
+Do not use without Void's permission
+"""
+
+import logging
+import os
+import threading
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from wiki.api import Scheduler
+from wiki.instrument import Histogram as Buckets
+
+log = logging.getLogger(__name__)
+
+
+def _labels(names, values, extra=''):
+    """Format a label set like {network="libera",type="join"}."""
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+class Metric:
+    """A named metric with one value per combination of labels.
+
+    Values are either recorded as things happen, or pulled from
+    collectors when the metrics are rendered.
+    """
+
+    kind = 'untyped'
+
+    def __init__(self, name, help, labels=()):
+        """Create a metric.
+
+        :param name: (string) Metric name
+        :param help: (string) Description shown to Prometheus
+        :param labels: (tuple) Label names
+        """
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.values = {}
+        self.collectors = []
+        self.lock = threading.Lock()
+
+    def collect(self, collector):
+        """Add a callable returning a dict of label values (tuple) to value."""
+        self.collectors.append(collector)
+
+    def render(self):
+        """Return the metric as lines of the text format."""
+        with self.lock:
+            values = dict(self.values)
+        for collector in self.collectors:
+            try:
+                values.update(collector())
+            except Exception:
+                log.exception(f'Collecting {self.name} failed')
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+        for labels, value in sorted(values.items()):
+            lines.append(f'{self.name}{_labels(self.labels, labels)} {value}')
+        return lines
+
+
+class Counter(Metric):
+    """A value that only goes up."""
+
+    kind = 'counter'
+
+    def inc(self, *labels, amount=1):
+        """Add :amount: to the counter for :labels:."""
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+
+class Gauge(Metric):
+    """A value that goes up and down."""
+
+    kind = 'gauge'
+
+    def set(self, value, *labels):
+        """Set the gauge for :labels: to :value:."""
+        with self.lock:
+            self.values[labels] = value
+
+
+class Histogram(Metric):
+    """Observed values sorted into buckets."""
+
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), bounds=Buckets.latency_bounds):
+        """Create a histogram.
+
+        :param bounds: (tuple) Sorted upper bounds of the buckets
+        """
+        super().__init__(name, help, labels)
+        self.bounds = bounds
+
+    def observe(self, value, *labels):
+        """Add :value: to the histogram for :labels:."""
+        with self.lock:
+            buckets = self.values.get(labels)
+            if buckets is None:
+                buckets = self.values[labels] = Buckets(self.bounds)
+            buckets.observe(value)
+
+    def render(self):
+        """Return the metric as lines of the text format."""
+        with self.lock:
+            values = {labels: (list(buckets.counts), buckets.count, buckets.total) for labels, buckets in self.values.items()}
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+        for labels, (counts, count, total) in sorted(values.items()):
+            seen = 0
+            for bound, bucket in zip(self.bounds + ('+Inf',), counts):
+                seen += bucket
+                le = f'le="{bound}"'
+                lines.append(f'{self.name}_bucket{_labels(self.labels, labels, le)} {seen}')
+            lines.append(f'{self.name}_sum{_labels(self.labels, labels)} {total}')
+            lines.append(f'{self.name}_count{_labels(self.labels, labels)} {count}')
+        return lines
+
+
+class Registry:
+    """All metrics of a process."""
+
+    def __init__(self):
+        """Create an empty registry."""
+        self.metrics = {}
+        self.lock = threading.Lock()
+        self.server = None
+
+    def _get(self, cls, name, help, labels, **kwargs):
+        """Return metric :name:, creating it the first time.
+
+        Handlers ask again after every reload and get the same metric back,
+        unless the reloaded code gave it other labels.
+        """
+        with self.lock:
+            metric = self.metrics.get(name)
+            if metric is None or (type(metric) is cls and metric.labels != tuple(labels)):
+                metric = self.metrics[name] = cls(name, help, labels, **kwargs)
+            elif type(metric) is not cls:
+                raise ValueError(f'Metric "{name}" is a {metric.kind}')
+            return metric
+
+    def counter(self, name, help, labels=()):
+        """Return counter :name:."""
+        return self._get(Counter, name, help, labels)
+
+    def gauge(self, name, help, labels=()):
+        """Return gauge :name:."""
+        return self._get(Gauge, name, help, labels)
+
+    def histogram(self, name, help, labels=(), bounds=Buckets.latency_bounds):
+        """Return histogram :name:."""
+        return self._get(Histogram, name, help, labels, bounds=bounds)
+
+    def render(self):
+        """Return every metric in the Prometheus text format."""
+        with self.lock:
+            metrics = sorted(self.metrics.items())
+        lines = []
+        for _, metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path):
+        """Atomically write every metric to :path:, for the node exporter textfile collector."""
+        temp = f'{path}.tmp'
+        with open(temp, 'w') as export:
+            export.write(self.render())
+        os.replace(temp, path)
+
+    def serve(self, port, lock=None):
+        """Serve the metrics over HTTP on localhost.
+
+        :param port: (int) Port to listen on
+        :param lock: (Lock) Held while rendering, so collectors see consistent state
+        """
+        registry = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if lock is None:
+                    body = registry.render()
+                else:
+                    with lock:
+                        body = registry.render()
+                body = body.encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass  # Scrapes would flood the log
+
+        self.stop()
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), MetricsHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        """Stop serving metrics over HTTP."""
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+
+def watch_wikis(registry):
+    """Report the request schedulers of every wiki host in :registry:."""
+    def collector(key):
+        def collect():
+            return {(host,): scheduler.stats()[key] for host, scheduler in list(Scheduler.schedulers.items())}
+        return collect
+    registry.gauge('voidbot_wiki_queue_depth', 'Wiki requests waiting for a slot.', ('host',)).collect(collector('depth'))
+    registry.gauge('voidbot_wiki_active', 'Wiki requests in flight.', ('host',)).collect(collector('active'))
+    names = {Scheduler.URGENT: 'urgent', Scheduler.WRITE: 'write', Scheduler.READ: 'read'}
+
+    def attempts():
+        return {
+            (host, names[priority]): count
+            for host, scheduler in list(Scheduler.schedulers.items())
+            for priority, (count, _, _) in scheduler.stats()['waits'].items()
+        }
+    registry.counter('voidbot_wiki_attempts_total', 'Wiki requests sent, retries included.', ('host', 'priority')).collect(attempts)
+    registry.counter('voidbot_wiki_retries_total', 'Wiki requests retried.', ('host',)).collect(collector('retried'))
+    registry.counter('voidbot_wiki_failures_total', 'Wiki requests that ran out of retries.', ('host',)).collect(collector('failed'))
@@ -0,0 +1,93 @@
+"""Run VoidBot on several networks from one process.
+
+All connections are driven by one reactor loop and share the loaded
+model and wiki sessions. Channels, ACLs, lockdown state and flood
+windows stay with each connection.
+Do not use without Void's permission
+"""
+
+import logging
+
+from irc.bot import ServerSpec
+from irc.client import Reactor
+from voidbot import Shared, VoidBot
+
+log = logging.getLogger(__name__)
+
+
+class SharedReactor(Reactor):
+    """A reactor driving the connections of several bots in one loop."""
+
+    def __init__(self):
+        """Create a reactor without connections of its own."""
+        super().__init__()
+        self.children = []
+
+    def child(self):
+        """Return a new NetworkReactor running on this loop."""
+        reactor = NetworkReactor(self)
+        self.children.append(reactor)
+        return reactor
+
+    @property
+    def sockets(self):
+        """Return the sockets of all bots."""
+        return [sock for child in self.children for sock in child.sockets]
+
+    def process_data(self, sockets):
+        """Let every bot read from its ready sockets."""
+        for child in self.children:
+            child.process_data(sockets)
+
+
+class NetworkReactor(Reactor):
+    """The reactor of one bot.
+
+    Events and handlers stay separate from other bots, while the
+    scheduler and lock are those of the SharedReactor.
+    """
+
+    def __init__(self, parent):
+        """Create a reactor attached to :parent:."""
+        super().__init__()
+        self.parent = parent
+        self.scheduler = parent.scheduler
+        self.mutex = parent.mutex
+
+
+class Manager:
+    """Manages VoidBots on several networks."""
+
+    def __init__(self):
+        """Create a manager without bots."""
+        self.reactor = SharedReactor()
+        self.shared = Shared()
+        self.bots = {}
+
+    def add(self, name, password, host, port=6697, bot_class=VoidBot, **kwargs):
+        """Add a bot for another network.
+
+        :param name: (string) Network name, None for the main network
+        :param password: (string) NickServ password on that network
+        :param host: (string) IRC server
+        :param port: (int) Port of the IRC server, using SSL
+        :param kwargs: Passed on to the bot, such as nickname, cloak and dev
+        :return: (VoidBot) The new bot
+        """
+        bot = bot_class(
+            password,
+            server=ServerSpec(host, port),
+            name=name,
+            shared=self.shared,
+            reactor_factory=self.reactor.child,
+            **kwargs
+        )
+        self.bots[name] = bot
+        return bot
+
+    def start(self):
+        """Connect every bot and run forever."""
+        for name, bot in self.bots.items():
+            log.info(f'Connecting to {name or "main network"}')
+            bot._connect()
+        self.reactor.process_forever()
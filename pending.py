@@ -0,0 +1,137 @@
+"""Track operations that wait on ChanServ.
+
+Do not use without Void's permission
+"""
+
+import irc.modes
+import logging
+import time
+from irc.strings import lower
+
+log = logging.getLogger(__name__)
+
+
+class PendingOp:
+    """An operation to run once we are opped in a channel."""
+
+    def __init__(self, callback, deadline):
+        """Create a pending operation."""
+        self.callback = callback
+        self.items = []
+        self.deadline = deadline
+        self.attempts = 1
+
+
+class PendingOps:
+    """Operations waiting for ops, and nicks waiting for USERHOST replies.
+
+    Everything has a deadline. Operations ask ChanServ again up to
+    :retries: times before they are dropped and reported, so nothing
+    stays around forever.
+    """
+
+    def __init__(self, bot, timeout=30, retries=2, user_limit=10000):
+        """Create an empty tracker.
+
+        :param bot: (VoidBot) Bot whose connection is used
+        :param timeout: (int) Seconds to wait for ChanServ or USERHOST
+        :param retries: (int) Times to ask ChanServ again
+        :param user_limit: (int) Max number of nicks awaiting USERHOST
+        """
+        self.bot = bot
+        self.timeout = timeout
+        self.retries = retries
+        self.user_limit = user_limit
+        self.ops = {}  # (channel, name) -> PendingOp
+        self.users = {}  # (channel, nick) -> deadline, both lowered
+        self.nicks = {}  # nick -> {lowered channel: channel as given}
+        self.timeouts = 0
+
+    def _ask_op(self, channel):
+        connection = self.bot.connection
+        connection.privmsg('ChanServ', f'OP {channel} {connection.get_nickname()}')
+
+    def need_op(self, channel, name, callback, *items):
+        """Run callback(connection, channel, *items) once we are opped in :channel:.
+
+        Operations share :name: per channel; a newer callback replaces an
+        older one, while items accumulate.
+        """
+        key = (lower(channel), name)
+        op = self.ops.get(key)
+        if op is None:
+            op = self.ops[key] = PendingOp(callback, time.monotonic() + self.timeout)
+            self._ask_op(channel)
+        op.callback = callback
+        op.items.extend(item for item in items if item not in op.items)
+
+    def opped(self, connection, channel):
+        """Run all operations waiting on ops in :channel:."""
+        chan = lower(channel)
+        for key in [key for key in self.ops if key[0] == chan]:
+            op = self.ops.pop(key)
+            op.callback(connection, channel, *op.items)
+
+    def on_mode(self, connection, event):
+        """Look for us being opped."""
+        if not self.ops:
+            return
+        modes = irc.modes.parse_channel_modes(' '.join(event.arguments))
+        if ['+', 'o', connection.get_nickname()] in modes:
+            self.opped(connection, event.target)
+
+    def add_users(self, channel, nicks):
+        """Remember that we wait on USERHOST replies for :nicks: in :channel:."""
+        deadline = time.monotonic() + self.timeout
+        for nick in nicks:
+            if len(self.users) >= self.user_limit:
+                log.warning(f'Too many nicks awaiting USERHOST, ignoring the rest for {channel}')
+                return
+            nick = lower(nick)
+            self.users[(lower(channel), nick)] = deadline
+            self.nicks.setdefault(nick, {})[lower(channel)] = channel
+
+    def has_user(self, channel, nick):
+        """Check whether we wait on a USERHOST reply for :nick: in :channel:."""
+        return (lower(channel), lower(nick)) in self.users
+
+    def take_user(self, nick):
+        """Stop waiting on :nick:.
+
+        :return: (set) Channels that waited on the nick, as given to add_users
+        """
+        nick = lower(nick)
+        channels = self.nicks.pop(nick, {})
+        for chan in channels:
+            self.users.pop((chan, nick), None)
+        return set(channels.values())
+
+    def sweep(self):
+        """Retry or expire everything past its deadline."""
+        now = time.monotonic()
+        for key, op in list(self.ops.items()):
+            if op.deadline > now:
+                continue
+            channel, name = key
+            if op.attempts <= self.retries:
+                op.attempts += 1
+                op.deadline = now + self.timeout
+                log.info(f'Asking ChanServ again for ops in {channel} ({name})')
+                self._ask_op(channel)
+            else:
+                self.ops.pop(key)
+                self.timeouts += 1
+                log.warning(f'Gave up on {name} in {channel}: ChanServ never opped us')
+        for key, deadline in list(self.users.items()):
+            if deadline <= now:
+                channel, nick = key
+                self.users.pop(key)
+                self.nicks[nick].pop(channel, None)
+                if not self.nicks[nick]:
+                    self.nicks.pop(nick)
+
+    def clear(self):
+        """Drop everything, such as after a disconnect."""
+        self.ops.clear()
+        self.users.clear()
+        self.nicks.clear()
@@ -0,0 +1,82 @@
+"""Profile handlers and commands.
+
+Do not use without Void's permission
+"""
+
+import cProfile
+import threading
+import time
+
+from wiki.instrument import Histogram
+
+
+class Profiler:
+    """Call counts and latency histograms of hot code paths.
+
+    Targets are named like 'run_handlers', 'Lockdown.on_join' or '$stats'.
+    """
+
+    bounds = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)  # seconds
+
+    def __init__(self):
+        """Create an empty profiler."""
+        self.latency = {}
+        self.lock = threading.Lock()
+        self.since = time.time()
+        self.capture = None
+
+    def record(self, target, elapsed):
+        """Record one call of :target: that took :elapsed: seconds."""
+        with self.lock:
+            histogram = self.latency.get(target)
+            if histogram is None:
+                histogram = self.latency[target] = Histogram(self.bounds)
+            histogram.observe(elapsed)
+
+    def reset(self):
+        """Forget everything recorded."""
+        with self.lock:
+            self.latency = {}
+            self.since = time.time()
+
+    def summary(self, prefix='', limit=8):
+        """Return one line per target, most total time first.
+
+        :param prefix: (string) Only report targets starting with this
+        :param limit: (int) Maximum number of lines
+        :return: (list) Human readable summaries
+        """
+        with self.lock:
+            targets = [(name, histogram) for name, histogram in self.latency.items() if name.startswith(prefix)]
+        targets.sort(key=lambda item: item[1].total, reverse=True)
+        return [
+            f'{name}: {histogram.count} calls, {histogram.total:.4f}s total, avg {histogram.mean * 1000:.3f}ms,'
+            f' p95 <= {histogram.quantile(0.95) * 1000:g}ms'
+            for name, histogram in targets[:limit]
+        ]
+
+    def start_capture(self, path):
+        """Start a cProfile capture of the calling thread, written to :path: when stopped.
+
+        :return: (boolean) False if a capture is already running
+        """
+        if self.capture is not None:
+            return False
+        profile = cProfile.Profile()
+        profile.enable()
+        self.capture = (profile, path)
+        return True
+
+    def stop_capture(self):
+        """Stop the running capture and write it out.
+
+        Must be called from the thread that started it.
+        :return: (string) Path written to, None if no capture was running
+        """
+        if self.capture is None:
+            return None
+        profile, path = self.capture
+        self.capture = None
+        profile.disable()
+        profile.dump_stats(path)
+        return path
@@ -0,0 +1,87 @@
+"""Carry runtime state over a restart.
+
+Do not use without Void's permission
+"""
+
+import logging
+import os
+import pickle
+import time
+import zlib
+
+log = logging.getLogger(__name__)
+
+version = 2
+max_age = 3600  # Seconds after which a snapshot is too old to trust
+
+
+def capture(bot):
+    """Return the runtime state of :bot: worth keeping over a restart.
+
+    Channel member lists and operations waiting on ops are left out, the
+    server resends the first when we rejoin and the second die with the
+    connection.
+    """
+    history = {}
+    for channel, channel_history in bot.history.channels.items():
+        history[channel] = channel_history.recent()[::-1]  # Oldest first, to add them back in order
+    return {
+        'version': version,
+        'time': time.time(),
+        'monotonic': time.monotonic(),  # To move handler stamps to the clock of the next process
+        'hosts': list(bot.hosts.hosts.items()),
+        'history': history,
+        'handlers': {type(handler).__name__: handler.export_state() for handler in bot.handlers},
+        'model_file': bot.shared.model_file,
+    }
+
+
+def write(bot, path):
+    """Atomically write a compressed snapshot of :bot: to :path:."""
+    data = zlib.compress(pickle.dumps(capture(bot), pickle.HIGHEST_PROTOCOL))
+    temp = f'{path}.tmp'
+    with open(temp, 'wb') as snapshot:
+        snapshot.write(data)
+    os.replace(temp, path)
+
+
+def read(path):
+    """Return the state saved at :path:, or None if it is missing, broken or too old."""
+    try:
+        with open(path, 'rb') as snapshot:
+            state = pickle.loads(zlib.decompress(snapshot.read()))
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        log.warning(f'Ignoring unreadable snapshot {path}: {e}')
+        return None
+    if state.get('version') != version or time.time() - state['time'] > max_age:
+        log.info(f'Ignoring outdated snapshot {path}')
+        return None
+    return state
+
+
+def restore(bot, state):
+    """Put the hosts, history and model reference of :state: back into :bot:."""
+    for nick, userhost in state['hosts']:
+        bot.hosts.set(nick, userhost)
+    for channel, records in state['history'].items():
+        history = bot.history.channel(channel)
+        for record in records:
+            history.add(record.nick, record.host, record.text, record.time)
+    if bot.shared.model_file is None:
+        bot.shared.model_file = state['model_file']
+
+
+def restore_handlers(bot, state):
+    """Hand the saved state of each handler to its current version.
+
+    Monotonic stamps are moved to our clock: the snapshot was written
+    time.time() - state['time'] seconds ago, which is where its monotonic
+    time falls on our clock.
+    """
+    offset = time.monotonic() - (time.time() - state['time']) - state['monotonic']
+    for handler in bot.handlers:
+        saved = state['handlers'].get(type(handler).__name__)
+        if saved:
+            handler.import_state(handler.rebase_state(saved, offset))
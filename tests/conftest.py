@@ -0,0 +1,34 @@
+import pytest
+from wiki.api import Api, Scheduler
+from wiki.standin import StandIn
+
+
+@pytest.fixture
+def standin():
+    """Start a StandIn with the given options, stopped after the test."""
+    servers = []
+
+    def start(**options):
+        options.setdefault('retry_after', 0)
+        options.setdefault('seed', 1)
+        server = StandIn(**options)
+        server.start()
+        servers.append(server)
+        return server
+    yield start
+    for server in servers:
+        server.stop()
+
+
+@pytest.fixture
+def make_api():
+    """Create Apis talking to a StandIn through their own fast retrying scheduler."""
+    hostnames = []
+
+    def make(server, hostname='test.standin', concurrency=2, retries=3):
+        Scheduler.schedulers[hostname] = Scheduler(hostname, concurrency, retries, backoff=0.01, max_backoff=0.05)
+        hostnames.append(hostname)
+        return Api(hostname, hostname, base_url=server.base_url, auth=False)
+    yield make
+    for hostname in hostnames:
+        Scheduler.schedulers.pop(hostname, None)
@@ -0,0 +1,70 @@
+import pytest
+from wiki.api import ApiError, ConnectionError, Scheduler
+from wiki.helpers import BulkBlock
+
+
+def test_page_and_edit(standin, make_api):
+    server = standin(pages={'Main Page': 'Hello'})
+    api = make_api(server)
+    assert api.page('Main Page') == 'Hello'
+    api.edit('Main Page', 'Hello again', 'Test')
+    assert api.page('Main Page') == 'Hello again'
+
+
+def test_reads_retried_on_502(standin, make_api):
+    server = standin(errors={'http-502': 1})
+    api = make_api(server)
+    with pytest.raises(ConnectionError):
+        api.siteinfo()
+    assert server.stats()['requests']['siteinfo'] == 4
+    assert api.scheduler.failed == 1
+
+
+def test_writes_not_retried_on_502(standin, make_api):
+    server = standin()
+    api = make_api(server)
+    api.get_token()
+    server.errors = {'http-502': 1}
+    with pytest.raises(ConnectionError):
+        api.block('Vandal', 'Test')
+    assert server.stats()['requests']['block'] == 1
+
+
+@pytest.mark.parametrize('error', ['http-503', 'maxlag', 'ratelimited'])
+def test_writes_retried_when_turned_away(standin, make_api, error):
+    server = standin()
+    api = make_api(server)
+    api.get_token()
+    server.errors = {error: 1}
+    with pytest.raises((ApiError, ConnectionError)):
+        api.block('Vandal', 'Test')
+    assert server.stats()['requests']['block'] == 4
+
+
+def test_token_fetched_at_write_priority(standin, make_api):
+    server = standin()
+    api = make_api(server)
+    api.block('Vandal', 'Test')
+    waits = api.scheduler.stats()['waits']
+    assert waits[Scheduler.URGENT][0] == 2  # Token and block
+    assert waits[Scheduler.READ][0] == 0
+    assert 'Vandal' in server.blocks
+
+
+def test_concurrent_writes_share_token_refresh(standin, make_api):
+    server = standin(latency=0.005, errors={'badtoken': 0.05})
+    apis = {f'wiki{i}': make_api(server, f'wiki{i}.standin', retries=5) for i in range(2)}
+    results = BulkBlock(apis, [f'User {i}' for i in range(40)], 'Test', workers=8).run()
+    assert server.stats()['injected']['badtoken'] > 0
+    assert [result.error for result in results if not result.ok] == []
+    assert len(server.blocks) == 40
+
+
+def test_stale_token_given_up_on(standin, make_api):
+    server = standin(errors={'badtoken': 1})
+    api = make_api(server)
+    with pytest.raises(ApiError) as error:
+        api.block('Vandal', 'Test')
+    assert error.value.code == 'badtoken'
+    assert server.stats()['requests']['block'] == 4
+    assert server.stats()['requests']['tokens'] == 4
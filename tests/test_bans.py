@@ -0,0 +1,49 @@
+import pytest
+from abuse.bans import BanIndex, normalize
+
+
+def test_normalize():
+    assert normalize('Foo') == 'foo!*@*'
+    assert normalize('Foo!Bar') == 'foo!bar@*'
+    assert normalize('Bar@Host.COM') == '*!bar@host.com'
+
+
+@pytest.mark.parametrize('mask, source', [
+    ('*!*@user/vandal', 'Nick!~u@user/vandal'),
+    ('*!*@198.51.100.7', 'nick!~u@198.51.100.7'),
+    ('*!*@10.1.*', 'nick!~u@10.1.2.3'),
+    ('*!*@2001:db8::/32', 'nick!~u@2001:db8::1'),
+    ('*!~bad*@*.example.com', 'nick!~badguy@host.example.com'),
+    ('spam*!*@*', 'SpamBot!~u@anywhere'),
+    ('Vandal', 'vandal!~u@host'),
+])
+def test_match(mask, source):
+    assert BanIndex([mask]).match(source) == mask
+
+
+@pytest.mark.parametrize('mask, source', [
+    ('*!*@user/vandal', 'nick!~u@user/vandal2'),
+    ('*!*@198.51.100.7', 'nick!~u@198.51.100.8'),
+    ('*!*@10.1.*', 'nick!~u@10.2.2.3'),
+    ('*!~bad*@*.example.com', 'nick!~good@host.example.com'),
+    ('spam*!*@*', 'ham!~u@anywhere'),
+])
+def test_no_match(mask, source):
+    assert BanIndex([mask]).match(source) is None
+
+
+def test_bucket_anchors_every_mask():
+    index = BanIndex(['*!*@?.com', 'zzz*!*@*.com', '*!~x*@*.com'])
+    assert len(index.wildcards) == 1  # All three share the .com bucket
+    assert index.match('x!y@a.com.b.com') is None
+    assert index.match('x!y@a.com') == '*!*@?.com'
+    assert index.match('zzzz!y@long.com') == 'zzz*!*@*.com'
+    assert index.match('n!~xy@long.com') == '*!~x*@*.com'
+
+
+def test_len_contains():
+    index = BanIndex(['*!*@*.example.com', '*!*@198.51.100.0/24', 'Nick', 'nick!*@*'])
+    assert len(index) == 3  # Masks are told apart once normalized
+    assert '*!*@198.51.100.0/24' in index
+    assert 'NICK!*@*' in index
+    assert '*!*@198.51.100.1' not in index
@@ -0,0 +1,21 @@
+from types import SimpleNamespace
+from irc.features import FeatureSet
+from batcher import ModeBatcher
+
+
+def limits(*isupport):
+    features = FeatureSet()
+    features.load(['VoidBot', *isupport, 'are supported by this server'])
+    return ModeBatcher(SimpleNamespace(connection=SimpleNamespace(features=features)))._limits()
+
+
+def test_limits_advertised():
+    assert limits('MODES=4', 'TARGMAX=KICK:2,JOIN:') == (4, 2)
+
+
+def test_limits_defaults():
+    assert limits() == (3, 1)
+
+
+def test_limits_unlimited():
+    assert limits('MODES=', 'TARGMAX=KICK:') == (12, 12)
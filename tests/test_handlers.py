@@ -0,0 +1,79 @@
+import pickle
+import pytest
+import threading
+from pathlib import Path
+from types import SimpleNamespace
+from irc.client import Event, NickMask
+import handlers
+from command import Command, CommandHandler
+from history import History
+from tracker import HostIndex
+
+
+class Unloadable:
+    def __reduce__(self):
+        return (__import__, ('module_that_does_not_exist',))
+
+
+def warm_start(tmp_path, train):
+    (tmp_path / 'abuse').mkdir()
+    (tmp_path / 'abuse/dataset.csv').write_text('text,abuse\nidiot,1\n')
+    with open(tmp_path / 'abuse/model.pickle', 'wb') as artifact:
+        pickle.dump(Unloadable(), artifact)
+    bot = SimpleNamespace(path=Path(tmp_path), shared=SimpleNamespace(model_file=None, training=True))
+    handler = SimpleNamespace(bot=bot, train=train, start_workers=lambda: None)
+    return bot, handler
+
+
+def test_warm_start_trains_when_loading_fails(tmp_path):
+    trained = []
+    bot, handler = warm_start(tmp_path, lambda: trained.append(True))
+    handlers.MLHandler.warm_start(handler)
+    assert trained
+    assert bot.shared.training is False
+
+
+def test_warm_start_resets_training_on_failure(tmp_path):
+    def train():
+        raise ValueError('broken dataset')
+    bot, handler = warm_start(tmp_path, train)
+    with pytest.raises(ValueError):
+        handlers.MLHandler.warm_start(handler)
+    assert bot.shared.training is False
+
+
+def flood_handler():
+    bot = SimpleNamespace(history=History())
+    return SimpleNamespace(bot=bot, mutex=threading.RLock(), tripped={})
+
+
+def message(text):
+    return Event('pubmsg', NickMask('spammer!u@host'), '#chan', [text])
+
+
+def test_check_flood_without_host_tracker():
+    handler = flood_handler()
+    assert [handlers.MLHandler.check_flood(handler, message(f'spam {i}')) for i in range(5)] == [False] * 4 + [True]
+    assert len(handler.bot.history.by_nick('spammer')) == 5
+
+
+def test_messages_remembered_once():
+    handler = flood_handler()
+    event = message('hello')
+    handlers.HostTracker.on_pubmsg(SimpleNamespace(bot=SimpleNamespace(history=handler.bot.history, hosts=HostIndex())), None, event)
+    handlers.MLHandler.check_flood(handler, event)
+    assert len(handler.bot.history.by_nick('spammer')) == 1
+
+
+def test_command_clash_warns(monkeypatch, caplog):
+    monkeypatch.setattr(CommandHandler, 'commands', [Command('status', lambda bot, event: None)])
+    monkeypatch.setattr(CommandHandler, 'master_commands', [])
+
+    class Clashing(handlers.Handler):
+        def status(self, bot, event):
+            pass
+    handler = Clashing(SimpleNamespace())
+    handler.commands.append(Command('status', handler.status))
+    handler.load_commands()
+    assert len(CommandHandler.commands) == 1 and not hasattr(CommandHandler.commands[0].action, 'handler')
+    assert 'Clashing command "status" not loaded' in caplog.text
@@ -0,0 +1,50 @@
+from wiki.helpers import BlockResult, BulkBlock
+
+
+def make_apis(server, make_api, count=2):
+    return {f'wiki{i}': make_api(server, f'wiki{i}.standin') for i in range(count)}
+
+
+def test_bulk_block_results(standin, make_api):
+    server = standin()
+    apis = make_apis(server, make_api)
+    results = BulkBlock(apis, ['A', 'B', 'C'], 'Test').run()
+    assert [(result.wiki, result.target, result.ok) for result in results] == [
+        (name, target, True) for name in apis for target in ['A', 'B', 'C']
+    ]
+    assert all(isinstance(result, BlockResult) and result.error is None for result in results)
+    assert server.stats()['requests']['block'] == 6
+    assert set(server.blocks) == {'A', 'B', 'C'}
+
+
+def test_bulk_global_block(standin, make_api):
+    server = standin()
+    results = BulkBlock(make_apis(server, make_api, 1), ['192.0.2.0/24'], 'Test', global_block=True).run()
+    assert results[0].ok
+    assert '192.0.2.0/24' in server.global_blocks
+
+
+def test_bulk_block_shares_token_fetch(standin, make_api):
+    server = standin(latency=0.01)
+    apis = make_apis(server, make_api)
+    results = BulkBlock(apis, [f'User {i}' for i in range(10)], 'Test', workers=8).run()
+    assert all(result.ok for result in results)
+    assert server.stats()['requests']['tokens'] == 2  # One per wiki, not one per block
+
+
+def test_bulk_block_refreshes_bad_token(standin, make_api):
+    server = standin(latency=0.01)
+    apis = make_apis(server, make_api)
+    for api in apis.values():
+        api.tokens['csrf'] = 'stale+\\'
+    results = BulkBlock(apis, [f'User {i}' for i in range(10)], 'Test', workers=8).run()
+    assert all(result.ok for result in results)
+    assert server.stats()['requests']['tokens'] == 2  # Refreshed once per wiki
+    assert all(api.tokens['csrf'] == server.token for api in apis.values())
+
+
+def test_bulk_block_reports_failures(standin, make_api):
+    server = standin(errors={'http-502': 1})
+    results = BulkBlock(make_apis(server, make_api, 1), ['A', 'B'], 'Test').run()
+    assert [result.ok for result in results] == [False, False]
+    assert all('502' in result.error for result in results)
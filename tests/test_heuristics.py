@@ -0,0 +1,84 @@
+import json
+import time
+from abuse.heuristics import Automaton, RuleSet
+from history import Record
+
+
+def test_automaton_overlapping_keywords():
+    automaton = Automaton({'he': ['he'], 'she': ['she'], 'hers': ['hers'], 'his': ['his']})
+    found = sorted((start, end, values[0]) for start, end, values in automaton.search('ushers'))
+    assert found == [(1, 4, 'she'), (2, 4, 'he'), (2, 6, 'hers')]
+
+
+def rules(*rules):
+    ruleset = RuleSet()
+    ruleset.compile(list(rules))
+    return ruleset
+
+
+def test_keywords_whole_words_only():
+    ruleset = rules({'name': 'bad', 'type': 'keyword', 'words': ['Spam'], 'points': 10})
+    assert ruleset.score('buy SPAM now') == {'bad': 10}
+    assert ruleset.score('spammer') == {}
+
+
+def test_keywords_see_through_lookalikes():
+    ruleset = rules({'name': 'bad', 'type': 'keyword', 'words': ['stupid'], 'points': 10})
+    assert ruleset.score('so ѕtuрid') == {'bad': 10}
+
+
+def test_rules_in_cyrillic():
+    ruleset = rules(
+        {'name': 'word', 'type': 'keyword', 'words': ['сука'], 'points': 10},
+        {'name': 'pattern', 'type': 'regex', 'pattern': 'пока|хорошо', 'points': 5},
+    )
+    assert ruleset.score('ты сука') == {'word': 10}
+    assert ruleset.score('ты СУКА, хорошо') == {'word': 10, 'pattern': 5}
+    assert ruleset.score('сукаблин') == {}
+
+
+def test_merged_regexes_all_match():
+    ruleset = rules(
+        {'name': 'link', 'type': 'regex', 'pattern': r'https?://bit\.ly/', 'points': 20},
+        {'name': 'caps', 'type': 'regex', 'pattern': 'free|cheap', 'points': 5},
+        {'name': 'never', 'type': 'regex', 'pattern': 'zzz', 'points': 1},
+    )
+    assert not ruleset.separate
+    assert ruleset.score('Cheap stuff at http://bit.ly/x') == {'link': 20, 'caps': 5}
+
+
+def test_unmergeable_regexes_matched_separately():
+    ruleset = rules(
+        {'name': 'plain', 'type': 'regex', 'pattern': 'foo', 'points': 1},
+        {'name': 'flags', 'type': 'regex', 'pattern': '(?x) b a r', 'points': 2},
+        {'name': 'named', 'type': 'regex', 'pattern': '(?P<word>baz)', 'points': 4},
+        {'name': 'named2', 'type': 'regex', 'pattern': '(?P<word>qux)', 'points': 8},
+        {'name': 'backref', 'type': 'regex', 'pattern': r'(\w)\1\1', 'points': 16},
+    )
+    assert len(ruleset.separate) == 4
+    assert ruleset.score('foo bar baz qux aaa') == {'plain': 1, 'flags': 2, 'named': 4, 'named2': 8, 'backref': 16}
+    assert ruleset.score('nothing') == {}
+
+
+def test_host_and_repeat_rules():
+    ruleset = rules(
+        {'name': 'staff', 'type': 'host', 'hosts': ['miraheze/Void'], 'points': -1000},
+        {'name': 'repeats', 'type': 'repeat', 'count': 3, 'window': 60, 'points': 30},
+    )
+    assert ruleset.window == 60
+    assert ruleset.score('hi', host='miraheze/Void') == {'staff': -1000}
+    now = time.time()
+    history = [Record(now - 1, 'n', 'h', 'Hello'), Record(now - 2, 'n', 'h', 'hello')]
+    assert ruleset.score('HELLO', history=history) == {'repeats': 30}
+    assert ruleset.score('HELLO', history=history[:1]) == {}
+
+
+def test_broken_file_keeps_rules(tmp_path):
+    path = tmp_path / 'rules.json'
+    path.write_text(json.dumps({'rules': [{'name': 'bad', 'words': ['spam'], 'points': 1}]}))
+    ruleset = RuleSet(str(path))
+    assert ruleset.names == ['bad']
+    path.write_text(json.dumps({'rules': [{'name': 'broken', 'type': 'regex', 'pattern': '(', 'points': 1}]}))
+    ruleset.mtime = None
+    assert not ruleset.reload()
+    assert ruleset.score('spam') == {'bad': 1}
@@ -0,0 +1,34 @@
+from irc.client import NickMask
+from history import ChannelHistory, History
+
+
+def test_ring_buffer_and_indexes_stay_bounded():
+    history = ChannelHistory(size=3, max_text=5)
+    for i in range(5):
+        history.add(f'nick{i % 2}', f'host{i % 2}', f'message {i}', now=i)
+    assert len(history) == 3
+    assert [record.text for record in history.recent()] == ['messa'] * 3
+    assert [record.time for record in history.recent()] == [4, 3, 2]
+    assert [record.time for record in history.by_nick('NICK0')] == [4, 2]
+    assert [record.time for record in history.by_host('host1')] == [3]
+    assert sum(len(entries) for entries in history.nicks.values()) == 3
+
+
+def test_lookup_limits():
+    history = ChannelHistory()
+    for i in range(10):
+        history.add('nick', 'host', str(i), now=i)
+    assert [record.text for record in history.by_nick('nick', limit=2)] == ['9', '8']
+    assert [record.text for record in history.recent(since=7)] == ['9', '8', '7']
+
+
+def test_history_across_channels():
+    history = History()
+    history.add('#a', NickMask('Nick!u@host'), 'one', now=1)
+    history.add('#B', NickMask('nick!u@host'), 'two', now=2)
+    assert [(channel, record.text) for channel, record in history.by_nick('nick')] == [('#B', 'two'), ('#a', 'one')]
+    assert history.get('#b') is history.get('#B')
+    history.remove('#b')
+    assert [record.text for _, record in history.by_host('host')] == ['one']
+    history.clear()
+    assert history.get('#a') is None
@@ -0,0 +1,53 @@
+import pytest
+from wiki.api import Api, ConnectionError
+from wiki.instrument import Histogram, Instrumentation
+
+
+@pytest.fixture
+def instrument(monkeypatch):
+    instrument = Instrumentation()
+    monkeypatch.setattr(Api, 'instrument', instrument)
+    return instrument
+
+
+def test_histogram_quantiles():
+    histogram = Histogram((1, 2, 3))
+    for value in (0.5, 1.5, 1.5, 2.5, 10):
+        histogram.observe(value)
+    assert histogram.counts == [1, 2, 1, 1]
+    assert histogram.mean == pytest.approx(3.2)
+    assert histogram.quantile(0.5) == 2
+    assert histogram.quantile(1) == float('inf')
+
+
+def test_write_timed_with_token_fetch(standin, make_api, instrument):
+    server = standin(latency=0.05)
+    make_api(server).block('Vandal', 'Test')
+    block = instrument.calls[('test.standin', 'block')]
+    assert block.latency.count == 1
+    assert block.latency.total >= 0.1  # Token fetch and block
+    assert instrument.calls[('test.standin', 'query:tokens')].latency.count == 1
+
+
+def test_badtoken_refresh_counted_as_retry(standin, make_api, instrument):
+    server = standin()
+    api = make_api(server)
+    api.tokens['csrf'] = 'stale+\\'
+    api.block('Vandal', 'Test')
+    block = instrument.calls[('test.standin', 'block')]
+    assert block.retries == 1
+    assert block.errors == {}
+
+
+def test_every_exception_is_a_failure(standin, make_api, instrument, monkeypatch):
+    server = standin(errors={'http-502': 1})
+    api = make_api(server)
+    with pytest.raises(ConnectionError):
+        api.siteinfo()
+
+    def broken(*args, **kwargs):
+        raise ValueError('unexpected')
+    monkeypatch.setattr(api.session, 'request', broken)
+    with pytest.raises(ValueError):
+        api.siteinfo()
+    assert instrument.calls[('test.standin', 'query:siteinfo')].errors == {'http-502': 1, 'ValueError': 1}
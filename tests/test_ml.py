@@ -0,0 +1,21 @@
+import numpy as np
+from abuse import ml
+
+
+def test_alpha_leaves_tolerance_alone():
+    texts = np.array(['idiot', 'dumb idiot', 'nice day', 'good day'] * 10)
+    labels = np.array([1, 1, 0, 0] * 10)
+    _, classifier, classifier2 = ml.fit(texts, labels, alpha=1e-7, alpha2=1e-6)
+    assert (classifier.alpha, classifier2.alpha) == (1e-7, 1e-6)
+    assert (classifier.tol, classifier2.tol) == ml.tol == (1e-6, 1e-5)
+
+
+def test_model_artifact_round_trip(tmp_path):
+    dataset = tmp_path / 'dataset.csv'
+    dataset.write_text('text,abuse\nidiot,1\nnice day,0\n')
+    path = str(tmp_path / 'model.pickle')
+    ml.save_model(path, ('models',), str(dataset))
+    assert ml.load_model(path, str(dataset)) == ('models',)
+    dataset.write_text('text,abuse\nidiot,1\nnice day,0\ngood day,0\n')
+    assert ml.load_model(path, str(dataset)) is None  # Fitted on another dataset
+    assert ml.load_model(str(tmp_path / 'missing.pickle'), str(dataset)) is None
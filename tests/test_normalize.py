@@ -0,0 +1,31 @@
+from types import SimpleNamespace
+from abuse import normalize
+
+
+def test_clean_formatting_and_invisible_characters():
+    assert normalize.clean('\x02bold\x02 \x0304,01red\x03 \x1ditalic\x0f') == 'bold red italic'
+    assert normalize.clean('\x04ff0000,00ff00hex\x04') == 'hex'
+    assert normalize.clean('in\u200bvis\xadible') == 'invisible'
+    assert normalize.clean('tabs\tstay') == 'tabs\tstay'
+
+
+def test_clean_folds_lookalikes():
+    assert normalize.clean('ѕtuрid') == 'stupid'  # Cyrillic s and p
+    assert normalize.clean('ｆｕｌｌｗｉｄｔｈ') == 'fullwidth'
+    assert normalize.clean('𝐛𝐨𝐥𝐝') == 'bold'
+    assert normalize.clean('ΑΒΓ') == 'ABΓ'  # Only lookalikes are mapped
+
+
+def test_normalized_forms():
+    text = normalize.Normalized('\x02Hello\x02, Wоrld!')  # Cyrillic o
+    assert text.raw == '\x02Hello\x02, Wоrld!'
+    assert str(text) == text.text == 'Hello, World!'
+    assert text.folded == 'hello, world!'
+    assert text.tokens == ['Hello', 'World']
+
+
+def test_of_normalizes_once():
+    event = SimpleNamespace(arguments=['hi', 'there'])
+    first = normalize.of(event)
+    assert first.text == 'hi there'
+    assert normalize.of(event) is first
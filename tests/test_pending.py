@@ -0,0 +1,56 @@
+from types import SimpleNamespace
+from pending import PendingOps
+
+
+class Connection:
+    def __init__(self):
+        self.sent = []
+
+    def get_nickname(self):
+        return 'Void-bot'
+
+    def privmsg(self, target, text):
+        self.sent.append((target, text))
+
+
+def make_pending(**options):
+    return PendingOps(SimpleNamespace(connection=Connection()), **options)
+
+
+def test_ops_run_once_opped_whatever_the_case():
+    pending = make_pending()
+    ran = []
+    pending.need_op('#Chan', 'ban', lambda connection, channel, *items: ran.append((channel, items)), 'a')
+    pending.need_op('#chan', 'ban', lambda connection, channel, *items: ran.append((channel, items)), 'b', 'a')
+    assert pending.bot.connection.sent == [('ChanServ', 'OP #Chan Void-bot')]
+    pending.opped(None, '#CHAN')
+    assert ran == [('#CHAN', ('a', 'b'))]
+    assert not pending.ops
+
+
+def test_users_match_whatever_the_case():
+    pending = make_pending()
+    pending.add_users('#Chan', ['Nick', 'Other'])
+    assert pending.has_user('#chan', 'nick')
+    assert pending.has_user('#CHAN', 'OTHER')
+    assert pending.take_user('NICK') == {'#Chan'}
+    assert not pending.has_user('#Chan', 'Nick')
+    assert pending.take_user('nick') == set()
+
+
+def test_sweep_retries_then_expires():
+    pending = make_pending(timeout=-1, retries=1)
+    pending.need_op('#Chan', 'ban', lambda *args: None)
+    pending.add_users('#Chan', ['Nick'])
+    pending.sweep()
+    assert len(pending.bot.connection.sent) == 2  # Asked ChanServ again
+    assert not pending.users and not pending.nicks
+    pending.sweep()
+    assert not pending.ops
+    assert pending.timeouts == 1
+
+
+def test_user_limit():
+    pending = make_pending(user_limit=2)
+    pending.add_users('#chan', ['a', 'b', 'c'])
+    assert len(pending.users) == 2
@@ -0,0 +1,119 @@
+from types import SimpleNamespace
+from irc.client import Event, NickMask
+import handlers
+from abuse.raid import Netsplits, RaidDetector, RollingCounter, SpaceSaving, is_netsplit, shape
+
+
+def test_rolling_counter_window():
+    counter = RollingCounter(window=10, buckets=10)
+    for second in range(10):
+        counter.add(100 + second)
+    assert counter.total(109.5) == 10
+    assert counter.total(115) == 4  # Seconds 106 to 109 are still in the window
+    assert counter.total(200) == 0
+
+
+def test_rolling_counter_reuses_buckets():
+    counter = RollingCounter(window=10, buckets=10)
+    counter.add(100, 5)
+    counter.add(110, 2)  # Same bucket, ten seconds later
+    assert counter.total(110) == 2
+
+
+def test_rolling_counter_rebase():
+    counter = RollingCounter(window=10, buckets=10)
+    counter.add(1000, 3)
+    counter.rebase(-900)
+    assert counter.total(100) == 3
+    assert counter.total(1000) == 0
+
+
+def test_space_saving_keeps_heavy_hitters():
+    sketch = SpaceSaving(size=4)
+    for i in range(100):
+        sketch.add('clone')
+        sketch.add(f'user{i}')
+    top = sketch.top(1)
+    assert top[0][0] == 'clone'
+    assert 100 <= top[0][1] <= 100 + 100 // 4 + 1  # Overestimated by at most the smallest count
+    assert len(sketch.counts) == 4
+    sketch.clear()
+    assert sketch.top() == []
+
+
+def test_shape():
+    assert shape('Guest123') == 'guest#'
+    assert shape('a1b22') == 'a#b#'
+
+
+def test_detector_flood_and_cooldown():
+    detector = RaidDetector(rate=5, window=10, cooldown=300)
+    reasons = [detector.join(NickMask(f'n{i}!u{i}@host{i}'), now=1000 + i * 0.1) for i in range(5)]
+    assert reasons[:4] == [None] * 4
+    assert reasons[4] == '5 joins within 10s'
+    assert detector.join(NickMask('n!u@other'), now=1001) is None  # Cooling down
+
+
+def test_detector_clones():
+    detector = RaidDetector(rate=100, clones=3)
+    reasons = [detector.join(NickMask(f'spam{i}!~bot{i}@{i}.example'), now=1000 + i * 5) for i in range(3)]
+    assert reasons[2] == '3+ joins sharing nick "spam#"'
+
+
+def test_detector_period_resets_sketches():
+    detector = RaidDetector(rate=100, clones=3, period=60)
+    detector.join(NickMask('spam1!a@x'), now=1000)
+    detector.join(NickMask('spam2!b@y'), now=1010)
+    assert detector.join(NickMask('spam3!c@z'), now=1070) is None  # The earlier two are from the last period
+
+
+def test_detector_ignores_gateway_keys():
+    detector = RaidDetector(rate=100, clones=3)
+    names = ['alice', 'bob', 'carol', 'dave', 'erin']
+    joins = [NickMask(f'{name}!sid{1000 + i}@id-{1000 + i}.ealing.irccloud.com') for i, name in enumerate(names)]
+    joins += [NickMask(f'Guest{50 + i}!~{name}@gateway/web/ip.192.0.2.{i}') for i, name in enumerate(names)]
+    joins += [NickMask(f'{name}_!uid{i}@charlton.irccloud.com') for i, name in enumerate(names)]
+    assert [detector.join(source, 'https://web.libera.chat', now=1000 + i) for i, source in enumerate(joins)] == [None] * 15
+    assert detector.join(NickMask('Guest1!~a@192.0.2.1'), now=1020) is None
+    assert detector.join(NickMask('Guest2!~b@192.0.2.1'), now=1021) is None
+    assert detector.join(NickMask('Guest3!~c@192.0.2.1'), now=1022) == '3+ joins sharing host "192.0.2.1"'
+
+
+def test_netsplits():
+    assert is_netsplit('*.net *.split')
+    assert is_netsplit('hub.example.net leaf.example.net')
+    assert not is_netsplit('Quit: *.net *.split')
+    assert not is_netsplit('Ping timeout: 240 seconds')
+    netsplits = Netsplits(grace=60)
+    netsplits.quit('Nick', '*.net *.split', now=1000)
+    netsplits.quit('Other', 'Quit: bye', now=1000)
+    assert netsplits.rejoining('nick', now=1030)
+    assert not netsplits.rejoining('other', now=1030)
+    assert not netsplits.rejoining('nick', now=1061)
+    netsplits.quit('Late', '*.net *.split', now=1100)
+    assert list(netsplits.quits) == ['late']  # Expired splits are forgotten
+
+
+def make_handler():
+    bot = SimpleNamespace(handlers=[])
+    handler = handlers.RaidHandler(bot)
+    bot.handlers.append(handler)
+    return handler
+
+
+def test_handler_skips_netsplit_rejoins():
+    handler = make_handler()
+    connection = SimpleNamespace(get_nickname=lambda: 'Void-bot')
+    for i in range(20):
+        handler.on_quit(connection, Event('quit', NickMask(f'user{i}!u{i}@host{i}'), None, ['*.net *.split']))
+    for i in range(20):
+        handler.on_join(connection, Event('join', NickMask(f'user{i}!u{i}@host{i}'), '#miraheze'))
+    assert '#miraheze' not in handler.detectors
+
+
+def test_handler_logs_raid_without_lockdown(caplog):
+    handler = make_handler()  # No Lockdown handler, as after a reload that failed half way
+    connection = SimpleNamespace(get_nickname=lambda: 'Void-bot')
+    for i in range(12):
+        handler.on_join(connection, Event('join', NickMask(f'user{i}!u{i}@host{i}'), '#miraheze'))
+    assert 'Possible raid in #miraheze' in caplog.text
@@ -0,0 +1,65 @@
+import time
+from types import SimpleNamespace
+from irc.client import NickMask
+import handlers
+import snapshot
+from abuse.raid import RaidDetector
+from history import History
+from tracker import HostIndex
+
+
+def make_bot():
+    bot = SimpleNamespace(history=History(), hosts=HostIndex(), shared=SimpleNamespace(model_file=None))
+    bot.handlers = [handlers.RaidHandler(bot)]
+    return bot
+
+
+def test_round_trip(tmp_path):
+    bot = make_bot()
+    bot.hosts.set('Nick', 'user@host')
+    for i in range(3):
+        bot.history.add('#chan', NickMask('Nick!user@host'), f'message {i}', 1000 + i)
+    bot.shared.model_file = 'abuse/model.pickle'
+    path = str(tmp_path / 'snapshot.bin')
+    snapshot.write(bot, path)
+
+    restored = make_bot()
+    state = snapshot.read(path)
+    snapshot.restore(restored, state)
+    snapshot.restore_handlers(restored, state)
+    assert restored.hosts.get('nick') == 'user@host'
+    assert [record.text for record in restored.history.get('#chan').recent()] == ['message 2', 'message 1', 'message 0']
+    assert restored.shared.model_file == 'abuse/model.pickle'
+
+
+def test_outdated_or_broken(tmp_path, monkeypatch):
+    path = str(tmp_path / 'snapshot.bin')
+    assert snapshot.read(path) is None
+    snapshot.write(make_bot(), path)
+    assert snapshot.read(path) is not None
+    monkeypatch.setattr(snapshot, 'max_age', -1)
+    assert snapshot.read(path) is None
+    with open(path, 'wb') as broken:
+        broken.write(b'not a snapshot')
+    assert snapshot.read(path) is None
+
+
+def test_detectors_moved_to_our_clock():
+    skew = 1e6  # The process writing the snapshot had a monotonic clock this far ahead of ours
+    bot = make_bot()
+    detector = bot.handlers[0].detectors['#chan'] = RaidDetector(rate=5)
+    then = time.monotonic() + skew
+    reasons = [detector.join(NickMask(f'user{i}!u{i}@host{i}'), now=then) for i in range(5)]
+    assert reasons[-1] is not None
+    state = snapshot.capture(bot)
+    state['monotonic'] += skew
+
+    restored = make_bot()
+    snapshot.restore_handlers(restored, state)
+    detector = restored.handlers[0].detectors['#chan']
+    now = time.monotonic()
+    assert abs(detector.tripped_at - now) < 1
+    assert abs(detector.period_start - now) < 1
+    assert detector.joins.total(now) == 5
+    later = now + detector.cooldown
+    assert [detector.join(NickMask(f'late{i}!l{i}@late{i}'), now=later) for i in range(5)][-1] is not None
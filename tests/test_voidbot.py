@@ -0,0 +1,61 @@
+import json
+import sys
+from irc.client import NickMask
+import aiobot
+import snapshot
+import voidbot
+
+
+def write(path, value):
+    path.write_text(json.dumps(value))
+
+
+def make_shared():
+    shared = voidbot.Shared()
+    shared.apis = {}  # No wiki credentials here
+    return shared
+
+
+def test_acls_per_network(tmp_path, monkeypatch):
+    (tmp_path / 'acl').mkdir()
+    write(tmp_path / 'save.json', {})
+    write(tmp_path / 'save-oftc.json', {})
+    write(tmp_path / 'acl/trusted.json', {'trusted': ['miraheze/Trusted']})
+    write(tmp_path / 'acl/trusted-oftc.json', {'trusted': ['oftc/Trusted']})
+    write(tmp_path / 'acl/banlist.json', {})
+    write(tmp_path / 'acl/banlist-oftc.json', {'*!*@bad.example': 'spam'})
+    monkeypatch.setattr(sys, 'argv', [str(tmp_path / 'ircbot.py')])
+    shared = make_shared()
+    main = voidbot.VoidBot('password', shared=shared)
+    oftc = aiobot.AioVoidBot('password', name='oftc', shared=shared)
+    assert oftc.name == 'oftc' and oftc.shared is shared
+    assert main.trusted == {'trusted': ['miraheze/Trusted']}
+    assert oftc.trusted == {'trusted': ['oftc/Trusted']}
+    assert main.dev == 'miraheze/Void' and oftc.dev is None
+    assert main.bans.match('n!u@bad.example') is None
+    assert oftc.bans.match('n!u@bad.example') == '*!*@bad.example'
+    oftc.banlist['*!*@worse.example'] = 'spam'
+    oftc.save()
+    assert json.loads((tmp_path / 'acl/banlist.json').read_text()) == {}
+    assert '*!*@worse.example' in json.loads((tmp_path / 'acl/banlist-oftc.json').read_text())
+
+
+def test_snapshot_restored_lazily(tmp_path, monkeypatch):
+    (tmp_path / 'acl').mkdir()
+    write(tmp_path / 'save.json', {})
+    write(tmp_path / 'acl/trusted.json', {})
+    write(tmp_path / 'acl/banlist.json', {})
+    monkeypatch.setattr(sys, 'argv', [str(tmp_path / 'ircbot.py')])
+    bot = voidbot.VoidBot('password', shared=make_shared())
+    bot.hosts.set('Nick', 'user@host')
+    bot.history.add('#chan', NickMask('Nick!user@host'), 'hello')
+    bot.write_snapshot()
+
+    restarted = voidbot.VoidBot('password', shared=make_shared())
+    assert restarted.hosts.get('nick') is None  # Not before the reactor runs
+    restarted.reactor.process_once()
+    assert restarted.hosts.get('nick') == 'user@host'
+    assert [record.text for record in restarted.history.get('#chan').recent()] == ['hello']
+    restarted.hosts.clear()
+    restarted.restore_snapshot()
+    assert restarted.hosts.get('nick') is None  # Only once
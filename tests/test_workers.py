@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+import threading
+from abuse import ml, workers
+
+
+@pytest.fixture(scope='module')
+def models():
+    texts = np.array(['idiot', 'dumb idiot', 'nice day', 'good day', 'idiot troll', 'hello there'] * 20)
+    labels = np.array([1, 1, 0, 0, 1, 0] * 20)
+    return ml.fit(texts, labels)
+
+
+def test_mapped_model_agrees(models, tmp_path):
+    workers.export_model(*models, str(tmp_path))
+    mapped = workers.MappedModel(str(tmp_path))
+    assert mapped.longest == 5  # Every term fits in 5 characters
+    for text in ['idiot', 'nice day', 'idiots everywhere', 'trolling idiotic day', '', 'hello there idiot']:
+        verdict, probability, verdict2 = workers.score(*models, text)
+        mapped_verdict, mapped_probability, mapped_verdict2 = mapped.score(text)
+        assert (mapped_verdict, mapped_verdict2) == (verdict, verdict2), text
+        assert mapped_probability == pytest.approx(probability), text
+        assert mapped.score(ml.process_text(text)) == (mapped_verdict, mapped_probability, mapped_verdict2), text
+
+
+def test_scoring_pool(models, tmp_path):
+    workers.export_model(*models, str(tmp_path))
+    pool = workers.ScoringPool(str(tmp_path), workers=1)
+    try:
+        results = []
+        done = threading.Event()
+
+        def callback(result):
+            results.append(result)
+            done.set()
+        assert pool.submit('dumb idiot', callback)
+        assert done.wait(30)
+        assert results[0][0] == workers.score(*models, 'dumb idiot')[0]
+    finally:
+        pool.close()
@@ -0,0 +1,60 @@
+"""Track who is who on IRC.
+
+Do not use without Void's permission
+"""
+
+from collections import OrderedDict
+from irc.strings import lower
+
+
+class HostIndex:
+    """A bounded map of nick to user@host.
+
+    The least recently updated nicks are forgotten first once :limit: is hit.
+    """
+
+    def __init__(self, limit=20000):
+        """Create an empty index."""
+        self.limit = limit
+        self.hosts = OrderedDict()
+
+    def __len__(self):
+        """Return the number of known nicks."""
+        return len(self.hosts)
+
+    def __contains__(self, nick):
+        """Check whether we know the user@host of :nick:."""
+        return lower(nick) in self.hosts
+
+    def set(self, nick, userhost):
+        """Remember :userhost: for :nick:."""
+        key = lower(nick)
+        self.hosts[key] = userhost
+        self.hosts.move_to_end(key)
+        if len(self.hosts) > self.limit:
+            self.hosts.popitem(last=False)
+
+    def get(self, nick):
+        """Return the user@host of :nick:, or None if unknown."""
+        return self.hosts.get(lower(nick))
+
+    def host(self, nick):
+        """Return only the host of :nick:, or None if unknown."""
+        userhost = self.hosts.get(lower(nick))
+        if userhost is None:
+            return None
+        return userhost.split('@', 1)[-1]
+
+    def rename(self, old, new):
+        """Move the entry of :old: to :new: after a nick change."""
+        userhost = self.hosts.pop(lower(old), None)
+        if userhost is not None:
+            self.set(new, userhost)
+
+    def remove(self, nick):
+        """Forget :nick:."""
+        self.hosts.pop(lower(nick), None)
+
+    def clear(self):
+        """Forget everyone."""
+        self.hosts.clear()
@@ -4,56 +4,195 @@ This is intended for internal use only
 Do not use this file outside of Void's permission.
 """
 
+import batcher
 import command
 import commands
 import handlers
+import history
+import tracker
 import logging
+import metrics
+import pending
+import profiling
+import snapshot
+import itertools
 import json
 import sys
 import os
 import ssl
+import time
 
 from importlib import reload
-from irc.bot import SingleServerIRCBot, ServerSpec
+from irc.bot import ExponentialBackoff, SingleServerIRCBot, ServerSpec
 from irc.connection import Factory
+from irc.dict import IRCDict
 from wiki.api import Api
+from wiki.instrument import Instrumentation
 from pathlib import Path
+from abuse.bans import BanIndex
 
 log = logging.getLogger(__name__)
 
 
+class Shared:
+    """State shared by every VoidBot of a process, whatever network they are on."""
+
+    def __init__(self):
+        """Create empty shared state."""
+        self.bots = []
+        self.trusted = {}  # Network label -> trusted list
+        self.banlist = {}  # Network label -> ban list
+        self.bans = {}  # Network label -> BanIndex of the ban list
+        self.apis = None
+        self.vectorizer = False
+        self.classifier = False
+        self.classifier2 = False
+        self.training = False
+        self.model_file = None
+        self.scoring = None
+        self.profiler = profiling.Profiler()
+        self.metrics = metrics.Registry()
+        metrics.watch_wikis(self.metrics)
+
+
+class Reconnect(ExponentialBackoff):
+    """Reconnect within seconds at first, backing off to :max_interval: while the server stays away."""
+
+    min_interval = 2
+    max_interval = 300
+
+    def reset(self):
+        """Start over from short delays, once connected."""
+        self.attempt_count = itertools.count(1)
+
+
+def _shared(name):
+    """Make attribute :name: of VoidBot live in its Shared state."""
+    return property(
+        lambda self: getattr(self.shared, name),
+        lambda self, value: setattr(self.shared, name, value),
+        doc=f'Shared {name}.'
+    )
+
+
+def _per_network(name):
+    """Make attribute :name: of VoidBot live in its Shared state, keyed by network label."""
+    return property(
+        lambda self: getattr(self.shared, name)[self.label],
+        lambda self, value: getattr(self.shared, name).__setitem__(self.label, value),
+        doc=f'{name.capitalize()} of this network.'
+    )
+
+
 class VoidBot(SingleServerIRCBot):
     """The setup for VoidBot, requires a lot of stuff.
 
     TODO: Docs
     """
 
-    def __init__(self, password):
-        """Create a VoidBot."""
-        factory = Factory(wrapper=ssl.wrap_socket)  # SSL support
-        super().__init__([ServerSpec('irc.libera.chat', 6697)], 'Void-bot', 'VoidBot', connect_factory = factory)
+    trusted = _per_network('trusted')
+    banlist = _per_network('banlist')
+    bans = _per_network('bans')
+    apis = _shared('apis')
+    vectorizer = _shared('vectorizer')
+    classifier = _shared('classifier')
+    classifier2 = _shared('classifier2')
+    profiler = _shared('profiler')
+    metrics = _shared('metrics')
+
+    keepalive = 10  # Seconds between connection checks
+    ping_idle = 60  # Ping the server after this long without hearing from it
+    ping_timeout = 20  # Reconnect if it does not answer within this
+    rejoin_timeout = 120  # Stop waiting for channels that neither take us back nor refuse us
+
+    def __init__(self, password, server=None, name=None, shared=None, reactor_factory=None,
+                 nickname='Void-bot', cloak='miraheze/bot/Void', dev=None):
+        """Create a VoidBot.
+
+        :param password: (string) NickServ password
+        :param server: (ServerSpec) Server to connect to, Libera by default
+        :param name: (string) Network name, None for the main network
+        :param shared: (Shared) State shared with bots on other networks
+        :param reactor_factory: (callable) Creates the reactor, see network.Manager
+        :param nickname: (string) Nick and NickServ account
+        :param cloak: (string) Cloak to wait for before joining, None to join on welcome
+        :param dev: (string) Host of the developer, by default miraheze/Void on the main network and nobody elsewhere
+        """
+        if reactor_factory is not None:
+            self.reactor_class = reactor_factory
+        if server is None:
+            server = ServerSpec('irc.libera.chat', 6697)
+        super().__init__([server], nickname, 'VoidBot', recon=Reconnect(), connect_factory = self.connect_factory())
         self.connection.buffer_class.errors = "replace"  # Encoded colors cause errors with utf-8
-        self.account = 'Void-bot'
-        self.dev = 'miraheze/Void'
+        self.shared = shared if shared is not None else Shared()
+        self.shared.bots.append(self)
+        self.name = name
+        self.account = nickname
+        self.cloak = cloak
+        self.dev = 'miraheze/Void' if dev is None and name is None else dev
         self.__password = password
         self.path = Path(os.path.dirname(os.path.abspath(sys.argv[0])))
+        self.label = name or 'main'  # Network label of metrics and ACLs
+        self.save_file = 'save.json' if name is None else f'save-{name}.json'
+        self.acl_suffix = '' if name is None else f'-{name}'
+        self.snapshot_file = 'snapshot.bin' if name is None else f'snapshot-{name}.bin'
         self.saves = {}
-        self.trusted = {}
-        self.banlist = {}
         self.channel_list = []
+        self.hosts = tracker.HostIndex()
+        self.history = history.History()
+        self.modes = batcher.ModeBatcher(self)
+        self.pending = pending.PendingOps(self)
         self.load()
-        self.apis = {
-            'meta': Api('miraheze', 'meta.miraheze.org'),
-            'cvt': Api('miraheze', 'cvt.miraheze.org'),
-            'testadminwiki': Api('testadminwiki', 'testwiki.wiki', script_path=''),
-            'botwiki': Api('miraheze', 'wiki.fossbots.org')
-        }
-        self.probably_connected = True
-        self.reactor.scheduler.execute_every(600, self.check_connection)
+        if self.saves.get('wiki_instrument', False) and Api.instrument is None:
+            Api.instrument = Instrumentation()
+        if self.apis is None:
+            self.apis = {
+                'meta': Api('miraheze', 'meta.miraheze.org'),
+                'cvt': Api('miraheze', 'cvt.miraheze.org'),
+                'testadminwiki': Api('testadminwiki', 'testwiki.wiki', script_path=''),
+                'botwiki': Api('miraheze', 'wiki.fossbots.org')
+            }
+        self.last_seen = time.monotonic()
+        self.ping_sent = None
+        self.lost_at = None
+        self.rejoining = IRCDict()  # Channels yet to take us back or refuse us
+        self.event_count = self.metrics.counter('voidbot_events_total', 'IRC events received.', ('network', 'type'))
+        self.command_count = self.metrics.counter('voidbot_commands_total', 'Commands run.', ('network', 'command'))
+        self.ping_rtt = self.metrics.histogram('voidbot_ping_rtt_seconds', 'Round trip time of connection checks.', ('network',))
+        self.recovery = self.metrics.histogram(
+            'voidbot_recovery_seconds', 'Time from losing the connection to having rejoined every channel.', ('network',)
+        )
+        self.metrics.gauge('voidbot_queue_depth', 'Outbound work waiting to be sent.', ('network', 'queue')).collect(
+            lambda: {(self.label, 'modes'): self.modes.depth, (self.label, 'need_op'): len(self.pending.ops)}
+        )
+        self.metrics.gauge('voidbot_lockdown', 'Channels under lockdown.', ('network', 'channel')).collect(
+            lambda: {(self.label, channel): 1 for channel in self.saves.get('locked_down', [])}
+        )
+        if self.shared.bots[0] is self:
+            self.reactor.scheduler.execute_every(15, self.export_metrics)
+            if self.saves.get('metrics_port'):
+                self.metrics.serve(self.saves['metrics_port'], self.reactor.mutex)
+        self.reactor.scheduler.execute_every(self.keepalive, self.check_connection)
         self.reactor.scheduler.execute_every(1200, self.save)
+        self.reactor.scheduler.execute_every(5, self.pending.sweep)
+        self.reactor.scheduler.execute_every(300, self.write_snapshot)
         self.handlers = handlers.load_handlers(self)
+        self.restored = False
+        self.reactor.scheduler.execute_after(0, self.restore_snapshot)  # Once the reactor runs, while we connect
         self.reactor.add_global_handler('all_events', self.run_handlers, 10)
 
+    def connect_factory(self):
+        """Return the factory used to open connections."""
+        return Factory(wrapper=ssl.wrap_socket)  # SSL support
+
+    def spawn(self, awaitable):
+        """Run a coroutine returned by a handler or command.
+
+        Only AioVoidBot has an event loop to run them on.
+        """
+        awaitable.close()
+        log.error('Coroutine handlers and commands need AioVoidBot')
+
     @property
     def acl(self):
         """Return both trusted list and ban list as one object."""
@@ -63,64 +202,156 @@ class VoidBot(SingleServerIRCBot):
 
     def load(self):
         """Load saved information from JSON file."""
-        with open(self.path / 'save.json', 'r') as saved:
+        with open(self.path / self.save_file, 'r') as saved:
             self.saves = json.loads(saved.read())
         chans = self.saves.get('channel_list', [])
         for chan in chans:
             if chan not in self.channel_list:
                 self.channel_list.append(chan)
-        self.load_acl()
+        if self.label not in self.shared.trusted:
+            self.load_acl()
 
     def load_acl(self):
-        """Load ACLs."""
-        with open(self.path / 'acl/trusted.json', 'r') as trusted:
+        """Load the ACLs of this network (acl/trusted-<name>.json and acl/banlist-<name>.json)."""
+        with open(self.path / f'acl/trusted{self.acl_suffix}.json', 'r') as trusted:
             self.trusted = json.loads(trusted.read())
-        with open(self.path / 'acl/banlist.json', 'r') as banlist:
+        with open(self.path / f'acl/banlist{self.acl_suffix}.json', 'r') as banlist:
             self.banlist = json.loads(banlist.read())
+        self.bans = BanIndex(self.banlist)
 
     def save(self):
         """Save dynamic information."""
-        with open(self.path / 'save.json', 'w') as saved:
+        with open(self.path / self.save_file, 'w') as saved:
             saved.write(json.dumps(self.saves))
-        with open(self.path / 'acl/banlist.json', 'w') as banlist:
+        with open(self.path / f'acl/banlist{self.acl_suffix}.json', 'w') as banlist:
             banlist.write(json.dumps(self.banlist))
+        if Api.instrument is not None:
+            Api.instrument.export(self.path / 'wikistats.json')
+
+    def restore_snapshot(self):
+        """Restore the runtime state saved by the last run, the first time only.
+
+        Runs as soon as the reactor does, so reading the snapshot does not
+        hold up connecting, and at the latest on welcome.
+        """
+        if self.restored:
+            return
+        self.restored = True
+        state = snapshot.read(self.path / self.snapshot_file)
+        if state is None:
+            return
+        snapshot.restore(self, state)
+        snapshot.restore_handlers(self, state)
+        log.info(f'Restored {len(self.hosts)} hosts and {len(self.history.channels)} channel histories from {self.snapshot_file}')
+
+    def write_snapshot(self):
+        """Save runtime state for a warm restart."""
+        self.restore_snapshot()  # Do not overwrite a snapshot we have yet to read
+        try:
+            snapshot.write(self, self.path / self.snapshot_file)
+        except Exception:
+            log.exception('Writing snapshot failed')
+
+    def export_metrics(self):
+        """Write metrics for the node exporter if saves['metrics_file'] is set."""
+        path = self.saves.get('metrics_file')
+        if path:
+            self.metrics.write(self.path / path)
 
     def _identify(self):
         """Login with NickServ."""
         self.connection.privmsg('NickServ', f'IDENTIFY {self.account} {self.__password}')
 
-    def _reload_stuff(self):
-        """Reload internal stuff."""
-        command.CommandHandler.clear_commands()
-        reload(commands)
-        reload(handlers)
-        self.handlers = handlers.load_handlers(self)
+    def _reload_stuff(self, targets=()):
+        """Reload internal stuff, keeping the state of handlers.
+
+        :param targets: (list) 'commands', 'handlers' or handler class names; everything if empty
+        :return: (string) What was reloaded and how long it took, or why it failed
+        """
+        begin = time.perf_counter()
+        targets = set(targets)
+        names = targets - {'commands', 'handlers'}
+        done = []
+        if not targets or 'commands' in targets:
+            lists = (command.CommandHandler.master_commands, command.CommandHandler.commands)
+            saved = [list(commands_list) for commands_list in lists]
+            disabled = {cmd.name for cmd in command.CommandHandler.commands if not cmd.enabled}
+            for commands_list in lists:
+                commands_list[:] = [cmd for cmd in commands_list if cmd.action.__module__ != 'commands']
+            try:
+                reload(commands)
+            except Exception as e:
+                for commands_list, old in zip(lists, saved):
+                    commands_list[:] = old
+                log.exception('Reloading commands failed')
+                return f'Reloading commands failed, kept the old ones: {e}'
+            for name in disabled:
+                command.CommandHandler.disable_command(name)
+            done.append('commands')
+        if not targets or 'handlers' in targets or names:
+            try:
+                reload(handlers)
+                unknown = [name for name in names if not isinstance(getattr(handlers, name, None), type)]
+                if unknown:
+                    return f'Unknown handler {", ".join(unknown)}, reloaded {" and ".join(done) or "nothing else"}'
+                replaced = {bot: handlers.load_handlers(bot, bot.handlers, names or None) for bot in self.shared.bots}
+            except Exception as e:
+                log.exception('Reloading handlers failed')
+                return f'Reloading handlers failed, kept the old ones: {e}'
+            for bot, new in replaced.items():
+                bot.handlers = new  # Events go to either the old or the new list, never a mix
+            done.append(', '.join(sorted(names)) if names else 'handlers')
+        elapsed = (time.perf_counter() - begin) * 1000
+        log.info(f'Reloaded {" and ".join(done)} in {elapsed:.1f}ms')
+        return f'Reloaded {" and ".join(done)} in {elapsed:.1f}ms'
 
     def check_connection(self):
-        """Verify connection to server."""
-        if self.connection.is_connected():
-            self.probably_connected = False
-            self.reactor.scheduler.execute_after(30, self.check_connection_call)
-            self.connection.ping('irc.libera.chat')
-
-    def check_connection_call(self):
-        """Handle possible disconnect."""
-        if not self.probably_connected:
-            log.info('Bot is probably disconnected')
-            self.connection.disconnect(message="I'm probably no longer connected to the server. Oops!")
+        """Verify connection to server.
+
+        Any line from the server proves the connection alive, so we only ping
+        after :ping_idle: quiet seconds, and give up :ping_timeout: later.
+        """
+        if not self.connection.is_connected():
+            return
+        now = time.monotonic()
+        if self.ping_sent is not None and self.last_seen > self.ping_sent:
+            self.ping_sent = None  # Heard from the server since, even if not a pong
+        if self.ping_sent is not None:
+            if now - self.ping_sent > self.ping_timeout:
+                log.info(f'No reply for {now - self.last_seen:.0f}s, bot is probably disconnected')
+                self.ping_sent = None
+                self.connection.disconnect(message="I'm probably no longer connected to the server. Oops!")
+        elif now - self.last_seen >= self.ping_idle:
+            self.ping_sent = now
+            self.connection.ping(self.connection.server)
 
     def run_handlers(self, connection, event):
         """Run all known handlers."""
+        self.last_seen = time.monotonic()
+        self.event_count.inc(self.label, event.type)
+        begin = time.perf_counter()
         for handler in self.handlers:
             handler.run(connection, event)
+        self.profiler.record('run_handlers', time.perf_counter() - begin)
 
     def on_disconnect(self, connection, event):
         """Safeguard against shutdowns."""
+        self.ping_sent = None
+        if self.lost_at is None:
+            self.lost_at = time.monotonic()
+        self.pending.clear()
         self.save()
+        self.write_snapshot()
+
+    def on_mode(self, connection, event):
+        """Run operations that waited on ops."""
+        self.pending.on_mode(connection, event)
 
     def on_pong(self, connection, event):
         """Bot is connected."""
-        self.probably_connected = True
+        if self.ping_sent is not None:
+            self.ping_rtt.observe(time.monotonic() - self.ping_sent, self.label)
+            self.ping_sent = None
 
     def get_version(self):
         """Return my bot description.
@@ -131,29 +362,68 @@ class VoidBot(SingleServerIRCBot):
 
     def on_welcome(self, connection, event):
         """Handle welcome."""
+        self.restore_snapshot()
         self._identify()
-        log.info('Bot has connected to IRC')
+        self.recon.reset()
+        log.info(f'Bot has connected to {connection.server}')
+        if self.cloak is None:
+            self._rejoin()
 
     def on_396(self, connection, event):
         """Join channels after cloak is applied."""
-        if event.arguments[0] == 'miraheze/bot/Void':
-            for channel in self.channel_list:
-                connection.join(channel)
+        if event.arguments[0] == self.cloak:
+            self._rejoin()
+
+    def _rejoin(self):
+        """Join every channel, waiting for each to take us back or refuse us."""
+        self.rejoining = IRCDict({channel: True for channel in self.channel_list})
+        self.modes.join(self.channel_list)
+        if self.lost_at is not None:
+            lost_at = self.lost_at
+            self.reactor.scheduler.execute_after(self.rejoin_timeout, lambda: self._rejoin_expired(lost_at))
+
+    def _rejoined(self, channel):
+        """Stop waiting for :channel:, measuring the recovery once no channel is left."""
+        self.rejoining.pop(channel, None)
+        if self.lost_at is not None and not self.rejoining:
+            elapsed = time.monotonic() - self.lost_at
+            self.lost_at = None
+            self.recovery.observe(elapsed, self.label)
+            log.info(f'Recovered from connection loss in {elapsed:.1f}s')
+
+    def _rejoin_expired(self, lost_at):
+        """Give up on a recovery that never finished, so the next one is measured from scratch."""
+        if self.lost_at == lost_at:
+            log.warning(f'Gave up waiting to rejoin {", ".join(self.rejoining)}')
+            self.rejoining.clear()
+            self.lost_at = None
+
+    def on_join(self, connection, event):
+        """Measure how long recovering from a lost connection took."""
+        if event.source.nick == connection.get_nickname():
+            self._rejoined(event.target)
+
+    def on_bannedfromchan(self, connection, event):
+        """Stop waiting for a channel that refused to take us back."""
+        self._rejoined(event.arguments[0])
+
+    on_nosuchchannel = on_toomanychannels = on_channelisfull = on_bannedfromchan
+    on_inviteonlychan = on_badchannelkey = on_badchanmask = on_nochanmodes = on_bannedfromchan
 
     def on_pubmsg(self, connection, event):
         """Search public messages for commands."""
         sender = event.source
-        if sender.host == self.dev and event.arguments[0] == '$reload':
-            self._reload_stuff()
-            connection.privmsg(event.target, 'Reloaded Commands!')
+        words = event.arguments[0].split()
+        if sender.host == self.dev and words[:1] == ['$reload']:
+            connection.privmsg(event.target, self._reload_stuff(words[1:]))
         handler = command.CommandHandler(event, self)
         handler.run()
 
     def on_privmsg(self, connection, event):
         """Handle commands in private messages."""
         sender = event.source
-        if sender.host == self.dev and event.arguments[0] == '$reload':
-            self._reload_stuff()
-            connection.privmsg(sender.nick, 'Reloaded Commands!')
+        words = event.arguments[0].split()
+        if sender.host == self.dev and words[:1] == ['$reload']:
+            connection.privmsg(sender.nick, self._reload_stuff(words[1:]))
         handler = command.CommandHandler(event, self)
         handler.run()
@@ -1,10 +1,134 @@
 """A representation of the MediaWiki Api."""
 
+import asyncio
+import functools
+import heapq
+import itertools
+import logging
+import random
 import requests
-import wiki.auth_config
+import threading
+import time
 DEFAULT_USER_AGENT = 'Void-Bot'
 requests.utils.default_user_agent = lambda: DEFAULT_USER_AGENT
 
+log = logging.getLogger(__name__)
+
+
+class Scheduler:
+    """Orders and paces the requests sent to a single wiki host.
+
+    Requests wait for a free slot (at most :concurrency: run at once),
+    and waiting requests are released in priority order, oldest first.
+    When the host asks us to slow down, the whole host is paused.
+    """
+
+    URGENT = 0  # Blocks and global blocks
+    WRITE = 1  # Edits
+    READ = 2  # Everything else
+
+    schedulers = {}
+    _registry_lock = threading.Lock()
+
+    def __init__(self, hostname, concurrency=2, retries=3, backoff=1, max_backoff=30):
+        """Create a scheduler.
+
+        :param hostname: (string) Host the scheduler is responsible for
+        :param concurrency: (int) Max number of requests in flight
+        :param retries: (int) Times a failed request is retried
+        :param backoff: (int) Base delay in seconds between retries
+        :param max_backoff: (int) Longest delay in seconds between retries
+        """
+        self.hostname = hostname
+        self.concurrency = concurrency
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.condition = threading.Condition()
+        self.queue = []
+        self.counter = itertools.count()
+        self.active = 0
+        self.paused_until = 0
+        self.waits = {self.URGENT: [0, 0.0, 0.0], self.WRITE: [0, 0.0, 0.0], self.READ: [0, 0.0, 0.0]}
+        self.retried = 0
+        self.failed = 0
+
+    @classmethod
+    def for_host(cls, hostname):
+        """Return the scheduler shared by everything talking to :hostname:."""
+        with cls._registry_lock:
+            if hostname not in cls.schedulers:
+                cls.schedulers[hostname] = cls(hostname)
+            return cls.schedulers[hostname]
+
+    def acquire(self, priority):
+        """Wait until a request of :priority: may be sent.
+
+        :return: (float) Seconds spent waiting
+        """
+        ticket = (priority, next(self.counter))
+        start = time.monotonic()
+        with self.condition:
+            heapq.heappush(self.queue, ticket)
+            while True:
+                paused = self.paused_until - time.monotonic()
+                if paused > 0:
+                    self.condition.wait(paused)
+                elif self.active >= self.concurrency or self.queue[0] != ticket:
+                    self.condition.wait()
+                else:
+                    break
+            heapq.heappop(self.queue)
+            self.active += 1
+            waited = time.monotonic() - start
+            stats = self.waits[priority]
+            stats[0] += 1
+            stats[1] += waited
+            stats[2] = max(stats[2], waited)
+            self.condition.notify_all()  # The next ticket may now be at the front
+        return waited
+
+    def release(self):
+        """Free the slot taken by acquire."""
+        with self.condition:
+            self.active -= 1
+            self.condition.notify_all()
+
+    def pause(self, seconds):
+        """Hold back every request to this host for :seconds:."""
+        with self.condition:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def delay(self, attempt, retry_after=None):
+        """Return how long to wait before retry number :attempt:.
+
+        A Retry-After value from the server is honoured (up to max_backoff),
+        otherwise exponential backoff with full jitter is used.
+        """
+        if retry_after is not None:
+            try:
+                return min(float(retry_after), self.max_backoff) + random.uniform(0, self.backoff)
+            except ValueError:
+                pass  # HTTP-date values are treated like a missing header
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    def stats(self):
+        """Return queue depth and wait times.
+
+        :return: (dict) depth, active, retried, failed, and per priority (count, mean, max) waits
+        """
+        with self.condition:
+            waits = {}
+            for priority, (count, total, longest) in self.waits.items():
+                waits[priority] = (count, total / count if count else 0.0, longest)
+            return {
+                'depth': len(self.queue),
+                'active': self.active,
+                'retried': self.retried,
+                'failed': self.failed,
+                'waits': waits
+            }
+
 
 class Api:
     """A class giving access to certain MediaWiki Api functions."""
@@ -15,21 +139,43 @@ class Api:
         'assert': 'bot'
     }
 
-    def __init__(self, name, hostname, script_path='/w', api_path='/api.php'):
+    retry_status = (429, 502, 503, 504)
+    retry_codes = ('maxlag', 'ratelimited', 'readonly')
+    # A failed write may still have been applied, so writes are only retried
+    # when the server says it turned them away
+    write_retry_status = (429, 503)  # With Retry-After
+    write_retry_codes = ('maxlag', 'ratelimited')
+    instrument = None  # An Instrumentation shared by every wiki, when enabled
+
+    def __init__(self, name, hostname, script_path='/w', api_path='/api.php', maxlag=5,
+                 base_url=None, auth=None):
         """Init Api class.
 
-        Only supports wikis using https.
+        Only supports wikis using https, unless base_url says otherwise.
         :param name: (string) Name used to fetch from auth_config
         :param hostname: (string) Hostname of wiki (meta.miraheze.org)
         :param script_path: (string) Script path of wiki (/w)
         :param api_path: (string) location of api.php
+        :param maxlag: (int) Seconds of replication lag we tolerate, None to disable
+        :param base_url: (string) Scheme and host to send requests to, such as
+        http://127.0.0.1:8080 for a wiki.standin server; https://hostname by default
+        :param auth: Auth for requests to use instead of the auth_config
+        entry of :name:, False to send requests unauthenticated
         """
         self.name = name
         self.hostname = hostname
         self.script_path = script_path
         self.api_path = api_path
-        self.url = f'https://{hostname}{script_path}{api_path}'
-        self.oauth = wiki.auth_config.auth[name]
+        self.url = f'{base_url or "https://" + hostname}{script_path}{api_path}'
+        if auth is None:
+            import wiki.auth_config  # Not needed, and maybe not present, when auth is given
+            auth = wiki.auth_config.auth[name]
+        self.oauth = auth or None
+        self.maxlag = maxlag
+        self.scheduler = Scheduler.for_host(hostname)
+        self.session = requests.Session()  # Keep connections alive between calls
+        self.tokens = {}
+        self.token_lock = threading.Lock()
 
     def handle_resp(self, response):
         """Process server response for validity.
@@ -45,21 +191,114 @@ class Api:
         r_json = response.json()
         if 'error' in r_json:
             raise ApiError(
-                f'{r_json["error"]["code"]}: {r_json["error"]["info"]}'
+                f'{r_json["error"]["code"]}: {r_json["error"]["info"]}',
+                r_json['error']['code']
             )
         return r_json
 
+    def request(self, method, priority=Scheduler.READ, **kwargs):
+        """Send a request through the scheduler and process the response.
+
+        Lagged, rate limited and unreachable hosts are retried with backoff.
+        Writes (post) are only retried when the server turned them away.
+        :param method: (string) HTTP method (get or post)
+        :param priority: (int) One of the Scheduler priority classes
+        :param kwargs: Passed on to requests (params or data)
+        :return: (JSON) server response as JSON
+        """
+        payload = kwargs['data'] if 'data' in kwargs else kwargs['params']
+        if self.maxlag is not None:
+            payload.setdefault('maxlag', self.maxlag)
+        return self._instrumented(payload, lambda trace: self._request(method, priority, kwargs, trace))
+
+    def _instrumented(self, payload, call):
+        """Return call(trace), recording it with the instrumentation when enabled.
+
+        Every exception counts as a failure of the call.
+        :param payload: (dictionary) Params naming the kind of call
+        :param call: (callable) Run with a trace list of retries and last response, or None
+        """
+        instrument = self.instrument
+        if instrument is None:
+            return call(None)
+        trace = [0, None]  # Retries, last response
+        start = time.perf_counter()
+        error = None
+        try:
+            return call(trace)
+        except ApiError as e:
+            error = e.code or 'unknown'
+            raise
+        except ConnectionError:
+            error = 'connection' if trace[1] is None else f'http-{trace[1].status_code}'
+            raise
+        except Exception as e:
+            error = type(e).__name__
+            raise
+        finally:
+            instrument.record(self.hostname, payload, time.perf_counter() - start, trace[0], trace[1], error)
+
+    def _request(self, method, priority, kwargs, trace=None):
+        """Run the retry loop of request.
+
+        :param trace: (list) Filled with the retry count and last response
+        """
+        scheduler = self.scheduler
+        write = method.lower() == 'post'
+        retried = trace[0] if trace is not None else 0  # Earlier retries of the same call
+        attempt = 0
+        while True:
+            retry_after = None
+            retryable = True
+            scheduler.acquire(priority)
+            try:
+                if trace is not None:
+                    trace[:] = retried + attempt, None
+                response = self.session.request(method, self.url, auth=self.oauth, **kwargs)
+                if trace is not None:
+                    trace[1] = response
+                retry_after = response.headers.get('Retry-After')
+                if response.status_code in self.retry_status:
+                    error = ConnectionError(
+                        f'Received HTTP "{response.status_code}" from "{self.hostname}"'
+                    )
+                    if write:
+                        retryable = response.status_code in self.write_retry_status and retry_after is not None
+                else:
+                    return self.handle_resp(response)
+            except ApiError as e:
+                if e.code not in (self.write_retry_codes if write else self.retry_codes):
+                    raise
+                error = e
+            except requests.RequestException as e:
+                error = ConnectionError(f'Request to "{self.hostname}" failed: {e}')
+                if write:
+                    retryable = isinstance(e, requests.ConnectTimeout)  # Never reached the server
+            finally:
+                scheduler.release()
+            if not retryable:
+                raise error
+            if attempt >= scheduler.retries:
+                with scheduler.condition:
+                    scheduler.failed += 1
+                raise error
+            with scheduler.condition:
+                scheduler.retried += 1
+            delay = scheduler.delay(attempt, retry_after)
+            log.info(f'Retrying request to "{self.hostname}" in {delay:.1f}s ({error})')
+            if retry_after is not None:
+                scheduler.pause(delay)  # The whole host asked us to back off
+            else:
+                time.sleep(delay)
+            attempt += 1
+
     def do_query(self, query):
         """Perform a query.
 
         :param query: (dictionary) Params of query
         """
         query.update(self.query)  # All querys must follow default
-        return self.handle_resp(requests.get(
-            self.url,
-            params=query,
-            auth=self.oauth
-        ))
+        return self.request('get', params=query)
 
     def siteinfo(self):
         """Perform query for siteinfo.
@@ -68,27 +307,58 @@ class Api:
         """
         query = self.query.copy()
         query.update({'meta': 'siteinfo'})
-        resp = requests.get(
-            self.url,
-            params=query,
-            auth=self.oauth
-        )
-        return self.handle_resp(resp)['query']
-
-    def get_token(self, type='csrf'):
+        return self.request('get', params=query)['query']
+
+    def get_token(self, type='csrf', refresh=False, priority=Scheduler.READ):
         """Fetch a token.
 
+        Tokens are cached, so parallel writes share a single fetch.
         :param type: (string) Type of token to fetch
+        :param refresh: (boolean) Ignore the cached token
+        :param priority: (int) Scheduler priority of the write needing the token
         :return: (string) token
         """
-        query = self.query.copy()
-        query.update({'meta': 'tokens', 'type': type})
-        resp = requests.get(
-            self.url,
-            params=query,
-            auth=self.oauth
-        )
-        return self.handle_resp(resp)['query']['tokens'][f'{type}token']
+        with self.token_lock:
+            if refresh or type not in self.tokens:
+                query = self.query.copy()
+                query.update({'meta': 'tokens', 'type': type})
+                resp = self.request('get', priority, params=query)
+                self.tokens[type] = resp['query']['tokens'][f'{type}token']
+            return self.tokens[type]
+
+    def post_with_token(self, priority, query, key='data'):
+        """Send a write request, fetching a fresh token whenever ours went stale.
+
+        Writes failing on the same stale token share one refresh: the first
+        to notice drops it, the others wait on the token lock and reuse the
+        token it fetched. Gives up after as many refreshes as the scheduler
+        has retries. Instrumentation times the whole write, token fetches
+        included.
+        :param priority: (int) One of the Scheduler priority classes
+        :param query: (dictionary) Params of the request, without token
+        :param key: (string) Whether to send query as "data" or "params"
+        :return: (JSON) server response as JSON
+        """
+        if self.maxlag is not None:
+            query = {'maxlag': self.maxlag, **query}
+        return self._instrumented(query, lambda trace: self._post_with_token(priority, query, key, trace))
+
+    def _post_with_token(self, priority, query, key, trace):
+        """Run the token refresh loop of post_with_token."""
+        attempt = 0
+        while True:
+            token = self.get_token(priority=priority)
+            try:
+                return self._request('post', priority, {key: dict(query, token=token)}, trace)
+            except ApiError as e:
+                if e.code != 'badtoken' or attempt >= self.scheduler.retries:
+                    raise
+            with self.token_lock:
+                if self.tokens.get('csrf') == token:
+                    self.tokens.pop('csrf')
+            attempt += 1
+            if trace is not None:
+                trace[0] += 1
 
     def edit(self, page, content, reason, minor=False, bot=True):
         """Edit a page.
@@ -99,25 +369,18 @@ class Api:
         :param minor: (boolean) Mark changes as minor
         :param bot: (boolean) Mark changes as bot
         """
-        token = self.get_token()
         query = self.query.copy()
         query.update({
             'action': 'edit',
             'title': page,
             'text': content,
-            'summary': reason,
-            'token': token
+            'summary': reason
         })
         if minor:
             query['minor'] = minor
         if bot:
             query['bot'] = bot
-        resp = requests.post(
-            self.url,
-            data=query,
-            auth=self.oauth
-        )
-        self.handle_resp(resp)  # Look for errors
+        self.post_with_token(Scheduler.WRITE, query)  # Look for errors
 
     def page(self, page):
         """Get the contents of a page.
@@ -132,12 +395,7 @@ class Api:
             'rvprop': 'content',
             'rvslots': 'main'
         })
-        resp = requests.get(
-            self.url,
-            params=query,
-            auth=self.oauth
-        )
-        resp = self.handle_resp(resp)
+        resp = self.request('get', params=query)
         pages = resp['query']['pages']
         page_id = list(pages.keys())[0]
         return pages[page_id]['revisions'][0]['slots']['main']['*']
@@ -157,7 +415,6 @@ class Api:
         :param allow_user_talk: (boolean) Allow user to edit own talk
         :param re_block: (boolean) Apply block over existing one
         """
-        token = self.get_token()
         query = self.query.copy()
         query.update({
             'action': 'block',
@@ -169,15 +426,9 @@ class Api:
             'autoblock': auto_block,
             'noemail': no_email,
             'allowusertalk': allow_user_talk,
-            'reblock': re_block,
-            'token': token
+            'reblock': re_block
         })
-        resp = requests.post(
-            self.url,
-            params=query,
-            auth=self.oauth
-        )
-        self.handle_resp(resp)  # Check for errors
+        self.post_with_token(Scheduler.URGENT, query, 'params')  # Check for errors
 
     def global_block(self, target, reason, expiry='never', anononly=True,
                      modify=False, alsolocal=True, localanononly=True,
@@ -193,7 +444,6 @@ class Api:
         :param localanononly: (boolean) Apply local block to anon users only
         :param revoke_local_talk: (boolean) Revoke talk page access locally
         """
-        token = self.get_token()
         query = self.query.copy()
         query.update({
             'action': 'globalblock',
@@ -204,15 +454,9 @@ class Api:
             'modify': modify,
             'alsolocal': alsolocal,
             'localanononly': localanononly,
-            'localblockstalk': revoke_local_talk,
-            'token': token
+            'localblockstalk': revoke_local_talk
         })
-        resp = requests.post(
-            self.url,
-            params=query,
-            auth=self.oauth
-        )
-        self.handle_resp(resp)  # Check for errors
+        self.post_with_token(Scheduler.URGENT, query, 'params')  # Check for errors
 
     def log(self, type=None, action=None, user=None, limit=10):
         """Get a set of log entries.
@@ -232,15 +476,39 @@ class Api:
         if user is not None:
             query['user'] = user
         query['lelimit'] = limit
-        resp = requests.get(
-            self.url,
-            params=query,
-            auth=self.oauth
-        )
-        resp = self.handle_resp(resp)
+        resp = self.request('get', params=query)
         return resp['query']['logevents']
 
 
+class AioApi:
+    """Awaitable access to an Api.
+
+    Calls run on a thread pool, so the event loop is never blocked.
+    Every Api method is available as a coroutine of the same name.
+    """
+
+    def __init__(self, api, executor=None):
+        """Init AioApi.
+
+        :param api: (Api) Api object to wrap
+        :param executor: (Executor) Pool to run calls on, None for the loop default
+        """
+        self.api = api
+        self.executor = executor
+
+    def __getattr__(self, name):
+        """Return an awaitable version of Api method :name:."""
+        method = getattr(self.api, name)
+        if not callable(method):
+            return method
+
+        @functools.wraps(method)
+        async def call(*args, **kwargs):
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, functools.partial(method, *args, **kwargs))
+        return call
+
+
 class ConnectionError(Exception):
     """Connection did not have a 200 status."""
 
@@ -250,4 +518,7 @@ class ConnectionError(Exception):
 class ApiError(Exception):
     """The Api returned some error."""
 
-    pass
+    def __init__(self, message, code=None):
+        """Keep the MediaWiki error code around for callers."""
+        super().__init__(message)
+        self.code = code
@@ -3,7 +3,13 @@
 Some are specific to VoidBot
 """
 
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from wiki.api import ApiError, ConnectionError, Scheduler
+
+BlockResult = namedtuple('BlockResult', ['wiki', 'target', 'ok', 'error', 'elapsed'])
 
 
 class Logger:
@@ -58,3 +64,55 @@ class FarmerPatrol:
         :param api: (Api) Api object for wiki
         """
         self.api = api
+
+
+class BulkBlock:
+    """A class blocking many targets across many wikis at once."""
+
+    def __init__(self, apis, targets, reason, global_block=False, workers=8, **options):
+        """Init BulkBlock.
+
+        :param apis: (dict) Api objects by name, such as bot.apis
+        :param targets: (list) Usernames, or IPs/ranges for global blocks
+        :param reason: (string) Reason for the blocks
+        :param global_block: (boolean) Use global_block instead of block
+        :param workers: (int) Max number of blocks in flight
+        :param options: Passed on to Api.block or Api.global_block
+        """
+        self.apis = apis
+        self.targets = targets
+        self.reason = reason
+        self.global_block = global_block
+        self.workers = workers
+        self.options = options
+
+    def _block(self, name, target):
+        """Block one target on one wiki, never raising."""
+        api = self.apis[name]
+        action = api.global_block if self.global_block else api.block
+        start = time.monotonic()
+        try:
+            action(target, self.reason, **self.options)
+            return BlockResult(name, target, True, None, time.monotonic() - start)
+        except (ConnectionError, ApiError) as e:
+            return BlockResult(name, target, False, str(e), time.monotonic() - start)
+
+    def _prefetch(self, name):
+        """Fetch the token of a wiki so all its blocks can share it."""
+        try:
+            self.apis[name].get_token(priority=Scheduler.URGENT)
+        except (ConnectionError, ApiError):
+            pass  # Each block will report the failure itself
+
+    def run(self):
+        """Perform all blocks.
+
+        :return: (list) BlockResult for every wiki and target pair, in order
+        """
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            list(pool.map(self._prefetch, self.apis))
+            futures = [
+                pool.submit(self._block, name, target)
+                for name in self.apis for target in self.targets
+            ]
+            return [future.result() for future in futures]
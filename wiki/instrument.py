@@ -0,0 +1,155 @@
+"""Instrumentation of calls made to the MediaWiki Api.
+
+Enable by assigning an Instrumentation to Api.instrument.
+"""
+
+import bisect
+import json
+import os
+import threading
+
+
+class Histogram:
+    """A histogram with fixed bucket bounds."""
+
+    latency_bounds = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)  # seconds
+    size_bounds = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)  # bytes
+
+    def __init__(self, bounds=latency_bounds):
+        """Create an empty histogram.
+
+        :param bounds: (tuple) Sorted upper bounds of the buckets
+        """
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # Last bucket holds everything larger
+        self.count = 0
+        self.total = 0
+
+    def observe(self, value):
+        """Add a value to the histogram."""
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+
+    @property
+    def mean(self):
+        """Return the mean of all observed values."""
+        return self.total / self.count if self.count else 0
+
+    def quantile(self, q):
+        """Return the upper bound of the bucket containing quantile :q:.
+
+        Values in the overflow bucket are reported as infinite.
+        """
+        if not self.count:
+            return 0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+    def to_dict(self):
+        """Return the histogram as a JSON serializable dict."""
+        return {'bounds': list(self.bounds), 'counts': self.counts, 'count': self.count, 'sum': self.total}
+
+
+class CallStats:
+    """Statistics of one kind of call to one wiki."""
+
+    def __init__(self):
+        """Create empty statistics."""
+        self.latency = Histogram()
+        self.sent = Histogram(Histogram.size_bounds)
+        self.received = Histogram(Histogram.size_bounds)
+        self.retries = 0
+        self.errors = {}
+
+    def to_dict(self):
+        """Return the statistics as a JSON serializable dict."""
+        return {
+            'latency': self.latency.to_dict(),
+            'sent': self.sent.to_dict(),
+            'received': self.received.to_dict(),
+            'retries': self.retries,
+            'errors': self.errors
+        }
+
+
+class Instrumentation:
+    """Collects per wiki, per action statistics of Api calls."""
+
+    def __init__(self):
+        """Create an empty collection."""
+        self.calls = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def action(payload):
+        """Name the kind of call made with :payload: (edit, block, query:revisions...)."""
+        action = payload.get('action', 'unknown')
+        if action == 'query':
+            return 'query:' + (payload.get('list') or payload.get('prop') or payload.get('meta') or 'other')
+        return action
+
+    def record(self, hostname, payload, elapsed, retries, response=None, error=None):
+        """Record one finished call.
+
+        :param hostname: (string) Wiki the call was made to
+        :param payload: (dictionary) Params of the call
+        :param elapsed: (float) Seconds spent, including retries
+        :param retries: (int) Number of retries needed
+        :param response: (Response) Last response received, if any
+        :param error: (string) Error code the call failed with, if any
+        """
+        if response is not None:
+            request = response.request
+            sent = len(request.url) + len(request.body or '')
+            received = len(response.content)
+        key = (hostname, self.action(payload))
+        with self.lock:
+            stats = self.calls.get(key)
+            if stats is None:
+                stats = self.calls[key] = CallStats()
+            stats.latency.observe(elapsed)
+            if response is not None:
+                stats.sent.observe(sent)
+                stats.received.observe(received)
+            stats.retries += retries
+            if error is not None:
+                stats.errors[error] = stats.errors.get(error, 0) + 1
+
+    def summary(self, hostname=None):
+        """Return one line per wiki and action.
+
+        :param hostname: (string) Only report on this wiki
+        :return: (list) Human readable summaries
+        """
+        lines = []
+        with self.lock:
+            for (host, action), stats in sorted(self.calls.items()):
+                if hostname is not None and host != hostname:
+                    continue
+                latency = stats.latency
+                errors = ', '.join(f'{code} {count}' for code, count in stats.errors.items()) or 'none'
+                lines.append(
+                    f'{host} {action}: {latency.count} calls, avg {latency.mean:.2f}s,'
+                    f' p95 <= {latency.quantile(0.95)}s, {stats.received.total} bytes in,'
+                    f' {stats.sent.total} bytes out, {stats.retries} retries, errors: {errors}'
+                )
+        return lines
+
+    def export(self, path):
+        """Atomically write all statistics to :path: as JSON."""
+        with self.lock:
+            data = {
+                host: {} for host, _ in self.calls
+            }
+            for (host, action), stats in self.calls.items():
+                data[host][action] = stats.to_dict()
+        temp = f'{path}.tmp'
+        with open(temp, 'w') as export:
+            export.write(json.dumps(data))
+        os.replace(temp, path)
@@ -0,0 +1,275 @@
+"""A local stand-in for the MediaWiki Api.
+
+Answers the part of api.php that Api uses: query (meta=tokens,
+meta=siteinfo, prop=revisions, list=logevents), edit, block and
+globalblock, from memory. Latency and errors (maxlag, ratelimited,
+badtoken, HTTP 5xx...) can be injected, so the retry and token paths
+of Api can be exercised offline. Point an Api at it with
+Api(name, hostname, base_url=standin.base_url, auth=False).
+
+Run from the repository root with: python -m wiki.standin [--port 8080]
+"""
+
+import argparse
+import json
+import random
+import secrets
+import threading
+import time
+
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+writes = ('edit', 'block', 'globalblock')
+
+
+class StandIn:
+    """An in-memory wiki served over HTTP on localhost."""
+
+    def __init__(self, latency=0.0, jitter=0.0, errors=None, retry_after=5, token_lifetime=None,
+                 pages=None, seed=None):
+        """Create a stand-in.
+
+        :param latency: (float) Seconds every request takes
+        :param jitter: (float) Up to this many seconds are added at random
+        :param errors: (dict) Error to rate (0 to 1) at which it is injected. Errors
+        are Api error codes (maxlag, ratelimited, badtoken...) or http-<status>
+        :param retry_after: (int) Retry-After header sent with maxlag and HTTP 429/503
+        :param token_lifetime: (float) Seconds after which a csrf token goes stale, None for never
+        :param pages: (dict) Title to text of the pages the wiki starts with
+        :param seed: (int) Seed of the error injection, for repeatable runs
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.errors = dict(errors or {})
+        self.retry_after = retry_after
+        self.token_lifetime = token_lifetime
+        self.pages = dict(pages or {})
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.token = None
+        self.token_time = 0
+        self.revision = 0
+        self.blocks = {}
+        self.global_blocks = {}
+        self.logevents = []
+        self.requests = Counter()  # action -> requests answered
+        self.injected = Counter()  # error -> times injected
+        self.server = None
+        self.base_url = None
+
+    def start(self, port=0):
+        """Serve on localhost in a background thread.
+
+        :param port: (int) Port to listen on, 0 for any free one
+        :return: (string) Base url to hand to Api
+        """
+        standin = self
+
+        class ApiHandler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # Keep-alive, like the real wikis
+            disable_nagle_algorithm = True  # Headers and body go out as separate writes
+
+            def respond(self, params):
+                status, headers, body = standin.handle(self.command, self.path, params)
+                body = body.encode()
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                self.respond({})
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                self.respond(dict(parse_qsl(body.decode(), keep_blank_values=True)))
+
+            def log_message(self, *args):
+                pass  # Benchmarks would flood the terminal
+
+        self.stop()
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), ApiHandler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base_url = f'http://127.0.0.1:{self.server.server_address[1]}'
+        return self.base_url
+
+    def stop(self):
+        """Stop serving."""
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def stats(self):
+        """Return the requests answered and errors injected so far."""
+        with self.lock:
+            return {'requests': dict(self.requests), 'injected': dict(self.injected)}
+
+    def handle(self, method, path, params):
+        """Answer one request.
+
+        :param method: (string) HTTP method
+        :param path: (string) Request path with query string
+        :param params: (dict) Form fields of a POST body
+        :return: (tuple) status, headers and body
+        """
+        url = urlsplit(path)
+        if not url.path.endswith('api.php'):
+            return 404, {'Content-Type': 'text/plain'}, 'Not Found'
+        params = dict(parse_qsl(url.query, keep_blank_values=True), **params)
+        action = params.get('action', 'help')
+        if action == 'query':
+            action = params.get('meta') or params.get('prop') or params.get('list') or 'query'
+        delay = self.latency
+        if self.jitter:
+            with self.lock:
+                delay += self.random.uniform(0, self.jitter)
+        if delay:
+            time.sleep(delay)
+        with self.lock:
+            self.requests[action] += 1
+            error = self._inject(action, params)
+            if error is not None:
+                self.injected[error] += 1
+                return self._error(error)
+            if action in writes:
+                if method != 'POST':
+                    return self._error('mustbeposted', f'The "{action}" module requires a POST request.')
+                if not self._valid_token(params.get('token')):
+                    return self._error('badtoken', 'Invalid CSRF token.')
+            return 200, {'Content-Type': 'application/json'}, json.dumps(self._answer(action, params))
+
+    def _inject(self, action, params):
+        """Pick the error to inject into this request, if any."""
+        for error, rate in self.errors.items():
+            if error == 'maxlag' and 'maxlag' not in params:
+                continue  # Only requests that set maxlag are refused for lag
+            if error == 'badtoken' and action not in writes:
+                continue
+            if self.random.random() < rate:
+                if error == 'badtoken':
+                    self.token = None  # The client has to fetch a new one
+                return error
+        return None
+
+    def _error(self, code, info=None):
+        """Return an HTTP error for http-<status>, otherwise an Api error."""
+        if code.startswith('http-'):
+            status = int(code[5:])
+            headers = {'Content-Type': 'text/plain'}
+            if status in (429, 503):
+                headers['Retry-After'] = str(self.retry_after)
+            return status, headers, f'Injected HTTP {status}'
+        headers = {'Content-Type': 'application/json', 'MediaWiki-API-Error': code}
+        if code == 'maxlag':
+            headers['Retry-After'] = str(self.retry_after)
+            info = info or 'Waiting for a database server: 10 seconds lagged.'
+        body = {'error': {'code': code, 'info': info or f'Injected "{code}" error.'}}
+        return 200, headers, json.dumps(body)
+
+    def _valid_token(self, token):
+        return token is not None and token == self._current_token(False)
+
+    def _current_token(self, issue=True):
+        """Return the csrf token, issuing a new one if it is missing or stale and :issue:."""
+        stale = self.token_lifetime is not None and time.monotonic() - self.token_time > self.token_lifetime
+        if (self.token is None or stale) and issue:
+            self.token = secrets.token_hex(16) + '+\\'
+            self.token_time = time.monotonic()
+        elif stale:
+            return None
+        return self.token
+
+    def _log(self, type, action, user, title, params):
+        """Add an entry to the log, newest last."""
+        self.logevents.append({
+            'logid': len(self.logevents) + 1,
+            'type': type,
+            'action': action,
+            'user': user,
+            'title': title,
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'comment': params.get('reason', ''),
+            'params': {'expiry': params.get('expiry', 'infinite')},
+        })
+
+    def _answer(self, action, params):
+        """Return the result of a valid request."""
+        if action == 'tokens':
+            type = params.get('type', 'csrf')
+            token = self._current_token() if type == 'csrf' else secrets.token_hex(16) + '+\\'
+            return {'batchcomplete': '', 'query': {'tokens': {f'{type}token': token}}}
+        if action == 'siteinfo':
+            return {'batchcomplete': '', 'query': {'general': {
+                'sitename': 'Stand-in', 'server': self.base_url, 'generator': 'MediaWiki stand-in',
+            }}}
+        if action == 'revisions':
+            pages = {}
+            for index, title in enumerate(params.get('titles', '').split('|')):
+                if title in self.pages:
+                    pages[str(index + 1)] = {'pageid': index + 1, 'ns': 0, 'title': title, 'revisions': [
+                        {'slots': {'main': {'contentmodel': 'wikitext', '*': self.pages[title]}}}
+                    ]}
+                else:
+                    pages[str(-index - 1)] = {'ns': 0, 'title': title, 'missing': ''}
+            return {'batchcomplete': '', 'query': {'pages': pages}}
+        if action == 'logevents':
+            found = []
+            type, subtype = params.get('letype'), params.get('leaction')
+            for event in reversed(self.logevents):
+                if type is not None and event['type'] != type:
+                    continue
+                if subtype is not None and f'{event["type"]}/{event["action"]}' != subtype:
+                    continue
+                if params.get('leuser') not in (None, event['user']):
+                    continue
+                found.append(event)
+                if len(found) >= int(params.get('lelimit', 10)):
+                    break
+            return {'batchcomplete': '', 'query': {'logevents': found}}
+        if action == 'edit':
+            title = params['title']
+            old = self.revision if title in self.pages else 0
+            self.pages[title] = params.get('text', '')
+            self.revision += 1
+            return {'edit': {'result': 'Success', 'title': title, 'oldrevid': old, 'newrevid': self.revision}}
+        if action == 'block':
+            user = params['user']
+            self.blocks[user] = params
+            self._log('block', 'block', 'StandIn', f'User:{user}', params)
+            return {'block': {'user': user, 'expiry': params.get('expiry', 'infinite'), 'reason': params.get('reason', '')}}
+        if action == 'globalblock':
+            target = params['target']
+            self.global_blocks[target] = params
+            self._log('gblblock', 'gblock', 'StandIn', f'User:{target}', params)
+            return {'globalblock': {'user': target, 'blocked': '', 'expiry': params.get('expiry', 'infinite')}}
+        return {'error': {'code': 'badvalue', 'info': f'Unrecognized value for parameter "action": {action}.'}}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve a local stand-in for the MediaWiki Api.')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds every request takes')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Up to this many seconds are added at random')
+    parser.add_argument('--error', action='append', default=[], metavar='CODE=RATE',
+                        help='Inject an error, such as maxlag=0.1 or http-503=0.05')
+    args = parser.parse_args()
+    errors = {}
+    for error in args.error:
+        code, _, rate = error.partition('=')
+        errors[code] = float(rate)
+    standin = StandIn(args.latency, args.jitter, errors)
+    print(f'Serving on {standin.start(args.port)}/w/api.php')
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        standin.stop()
+
+
+if __name__ == '__main__':
+    main()